@@ -20,6 +20,6 @@ echo "PostgreSQL is ready!"
 
 # Populate VectorDB
 echo "Populating Vector DB..."
-python -m src.database
+python -m src.ingest --incremental --prune
 
 echo "Vector DB is ready..."
\ No newline at end of file
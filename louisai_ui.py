@@ -6,12 +6,19 @@ from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from src.database import VectorDB, ExtractDocs
 from src.model import *
+from src.budget import RequestBudget
+from src.cache import SemanticAnswerCache
+from src.langchain_cache import PromptCache
+from src.ingest import chunk_id
+from src.metrics import LLMMetricsHandler, start_metrics_server
+from src.uploads import SessionIndex, UploadCache, file_hash
 from src.utils import check_required_env_vars
 from docx import Document as DocxDocument
 from io import BytesIO
 import re
 import os
 import tempfile
+import time
 
 
 # ---------- Setup Resources ----------
@@ -19,15 +26,32 @@ import tempfile
 def initialize_resources():
     load_dotenv()
     check_required_env_vars()
-    db = VectorDB()
+    db = VectorDB(search_mode="hybrid")
+    # Sessions share the reranker, batch their concurrent requests together
+    db.enable_rerank_worker()
+    # Load the reranker while the first question is being typed
+    db.warmup()
     db.enable_hnsw_indexing()
-    model = ChatOpenAI(model="gpt-4o-mini", temperature=0)
-    response = build_graph()
-    app = response.compile()
-    return db, model, app
+    db.enable_lexical_indexing()
+    db.enable_citation_indexing()
+    # Deterministic model, so identical prompts can be answered from the cache
+    model = ChatOpenAI(
+        model="gpt-4o-mini",
+        temperature=0,
+        # Token usage is reported when answers are streamed, for the request budget
+        stream_usage=True,
+        cache=PromptCache(path="data/llm_cache.sqlite"),
+        callbacks=[LLMMetricsHandler()],
+    )
+    start_metrics_server()
+    response = build_graph(parallel_graders=True)
+    app = CachedApp(
+        response.compile(), SemanticAnswerCache(path="data/answer_cache.sqlite")
+    )
+    return db, model, app, UploadCache("data/upload_cache")
 
 
-db, model, app = initialize_resources()
+db, model, app, upload_cache = initialize_resources()
 
 
 # ---------- Functions ----------
@@ -53,15 +77,17 @@ def generate_docx(content, filename="generated_document.docx"):
 def save_file_locally(file):
     temp_dir = tempfile.gettempdir()  # You can use a custom directory too
 
+    # Named by content hash, concurrent sessions never overwrite each other's upload
+    digest = file_hash(file.getvalue())
     file_extension = os.path.splitext(file.name)[1]
-    temp_file_path = os.path.join(temp_dir, f"uploaded_file{file_extension}")
+    temp_file_path = os.path.join(temp_dir, f"uploaded_{digest}{file_extension}")
 
     with open(temp_file_path, "wb") as f:
         f.write(file.getbuffer())
 
     print(f"File saved at: {temp_file_path}")
     # delete the temp file when done
-    return temp_file_path, file.type
+    return temp_file_path, file.type, digest
 
 
 def extract_file_content(file_path, file_type):
@@ -74,13 +100,30 @@ def extract_file_content(file_path, file_type):
     ]:
         return ExtractDocs().extract_document(file_path, "docx")
     elif file_type == "text/plain":
-        # For text files, you can return raw content instead of calling ExtractDocs
+        # Text files don't need parsing, only splitting into chunks
         with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+            return ExtractDocs().extract_text([f.read()])
 
     return None
 
 
+def load_uploaded_chunks(file_path, file_type, digest):
+    """
+    Parsed and embedded chunks of an upload, from the upload cache when this
+    file content was seen before.
+    """
+    cached = upload_cache.get(digest)
+    if cached is not None:
+        return cached
+    chunks = extract_file_content(file_path, file_type) or []
+    for chunk in chunks:
+        chunk.metadata["id"] = chunk_id(chunk.page_content, digest)
+        chunk.metadata["upload"] = digest
+    embeddings = db.embeddings.embed_documents([chunk.page_content for chunk in chunks])
+    upload_cache.set(digest, chunks, embeddings)
+    return chunks, embeddings
+
+
 def user_wants_file(text):
     keywords = ["generate", "create", "draft", "write", "document", "contract"]
     return any(k in text.lower() for k in keywords)
@@ -102,6 +145,9 @@ with st.sidebar:
         st.session_state.current_conversation_index = None
     if "file_uploader_key" not in st.session_state:
         st.session_state.file_uploader_key = "file_uploader_0"
+    if "session_index" not in st.session_state:
+        # Uploaded files are only searchable within this session
+        st.session_state.session_index = SessionIndex()
     if st.button("➕ New Conversation", use_container_width=True):
         st.session_state.conversations.append([])
         st.session_state.current_conversation_index = (
@@ -138,9 +184,10 @@ if tool_option == "Legal Assistant Chatbot":
     )
 
     if uploaded_file:
-        file_path, file_type = save_file_locally(uploaded_file)
+        file_path, file_type, digest = save_file_locally(uploaded_file)
         st.session_state["uploaded_file_path"] = file_path
         st.session_state["uploaded_file_type"] = file_type
+        st.session_state["uploaded_file_hash"] = digest
         st.success(
             "File uploaded and ready to be analyzed after you submit a question."
         )
@@ -153,31 +200,65 @@ if tool_option == "Legal Assistant Chatbot":
 
         file_path = st.session_state.get("uploaded_file_path", None)
         file_type = st.session_state.get("uploaded_file_type", None)
+        digest = st.session_state.get("uploaded_file_hash", None)
         file_content = None
         if file_path and file_type:
             with st.spinner("Extracting File Content..."):
-                file_content = extract_file_content(file_path, file_type)
-                db.add_documents(file_content)
+                file_content, embeddings = load_uploaded_chunks(
+                    file_path, file_type, digest
+                )
+                st.session_state.session_index.add(digest, file_content, embeddings)
                 # Prepare combined query if file exists
                 file_content = "\n\n".join(
                     [chunk.page_content for chunk in file_content]
                 )
 
-        with st.spinner("Thinking..."):
-            # Prepare context
-            inputs = {
-                "query": user_query,
-                "db": db,
-                "model": model,
-                "vectorstore_summary": "It includes all the trustable legal information available in Australia.",
-                "retrieved_docs": [],
-                "depth": 0,
-                "excluded_file_ids": set(),
-                "intent_type": "summarise" if uploaded_file else "qa",
-                "user_context": file_content if file_content else "",
-            }
+        # Prepare context
+        inputs = {
+            "query": user_query,
+            "db": db,
+            "model": model,
+            "vectorstore_summary": "It includes all the trustable legal information available in Australia.",
+            "retrieved_docs": [],
+            "depth": 0,
+            "excluded_file_ids": set(),
+            "intent_type": "summarise" if uploaded_file else "qa",
+            "user_context": file_content if file_content else "",
+            "budget": RequestBudget(),
+            "session_index": st.session_state.session_index,
+        }
+        output = {}
+        nodes_run = []
+        started = time.perf_counter()
+        first_token_at = None
+
+        with st.chat_message("ai"):
+            status = st.status("Thinking...")
+            placeholder = st.empty()
+            streamed, stream_id = "", None
             try:
-                output = app.invoke(inputs)
+                for mode, chunk in app.stream(
+                    inputs, stream_mode=["debug", "messages", "values"]
+                ):
+                    if mode == "debug" and chunk["type"] == "task":
+                        nodes_run.append(chunk["payload"]["name"])
+                        status.update(label=f"Running {nodes_run[-1]}...")
+                    elif mode == "messages":
+                        message, metadata = chunk
+                        if (
+                            metadata.get("langgraph_node") != "response_constructor"
+                            or not message.content
+                        ):
+                            continue
+                        if message.id != stream_id:
+                            # A grader sent the answer back, replace the draft
+                            stream_id, streamed = message.id, ""
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        streamed += message.content
+                        placeholder.markdown(streamed + "▌")
+                    elif mode == "values":
+                        output = chunk
                 response_data = output.get("response", "")
                 ai_message = (
                     response_data["messages"][-1].content
@@ -188,15 +269,36 @@ if tool_option == "Legal Assistant Chatbot":
                         else str(response_data)
                     )
                 )
+                status.update(label="Done", state="complete")
             except Exception as e:
                 ai_message = f"Error processing query: {str(e)}"
+                status.update(label="Error", state="error")
+            finished = time.perf_counter()
+            placeholder.write(ai_message)
+            if output.get("budget_exhausted"):
+                st.caption("Stopped early: this answer hit the request time/cost limit.")
+
+        with st.expander("Debug"):
+            st.write(
+                {
+                    "time_to_first_token_ms": (
+                        round((first_token_at - started) * 1000)
+                        if first_token_at
+                        else None
+                    ),
+                    "total_ms": round((finished - started) * 1000),
+                    "nodes": nodes_run,
+                    "cache_hit": output.get("cache_hit", False),
+                    "budget": inputs["budget"].stats(),
+                }
+            )
 
-        # Add AI message to conversation and display it
+        # Add AI message to conversation
         current_conversation.append({"role": "ai", "content": ai_message})
-        st.chat_message("ai").write(ai_message)
         # Clear uploaded file data after processing the question
         st.session_state["uploaded_file_path"] = None
         st.session_state["uploaded_file_type"] = None
+        st.session_state["uploaded_file_hash"] = None
 
         # Optionally, reset file uploader widget by incrementing the key
         current_key = st.session_state.file_uploader_key
@@ -0,0 +1,353 @@
+from itertools import islice, product
+from typing import Dict, List, Optional
+import numpy as np
+import tempfile
+import argparse
+import json
+import time
+import sys
+
+from src.cache import LRUCache
+from src.ingest import iter_corpus_rows
+
+
+def load_questions(jsonl_path: Optional[str] = None, limit: int = 200) -> List[Dict]:
+    """(question, relevant source version_id) pairs from the legal QA dataset."""
+    return [
+        {"question": row["question"], "version_id": row["source"]["version_id"]}
+        for row in islice(iter_corpus_rows(jsonl_path=jsonl_path), limit)
+    ]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+# Fixed query/document set for the reranker backend parity check
+PARITY_QUERY = "What must a court consider before granting bail to an accused person?"
+PARITY_DOCUMENTS = [
+    "R v NGUYEN [2001] NSWCCA 334 -> The applicant sought bail pending appeal. The "
+    "court considered the strength of the Crown case, the risk of flight and the "
+    "time the applicant would spend in custody before the appeal was heard.",
+    "Bail Act 2013 (NSW) s 17 -> A bail authority must assess any bail concerns, "
+    "including whether the accused person, if released, will fail to appear, "
+    "commit a serious offence, endanger the safety of victims or the community, "
+    "or interfere with witnesses or evidence.",
+    "Mabo v Queensland (No 2) [1992] HCA 23 -> The common law of Australia "
+    "recognises a form of native title reflecting the entitlement of the "
+    "indigenous inhabitants to their traditional lands.",
+    "Residential Tenancies Act 2010 (NSW) s 41 -> A landlord must give a tenant "
+    "at least 60 days notice of a rent increase under a periodic agreement.",
+    "Smith v Jones [2015] VSC 12 -> The plaintiff claimed damages for breach of "
+    "contract after the defendant failed to deliver the goods by the agreed date.",
+    "Crimes Act 1900 (NSW) s 61 -> Whosoever assaults any person, although not "
+    "occasioning actual bodily harm, shall be liable to imprisonment for two years.",
+    "R v Brown [2019] QCA 87 -> On the application for bail the court weighed the "
+    "applicant's criminal history, community ties and the conditions proposed to "
+    "mitigate the risk of reoffending.",
+    "Fair Work Act 2009 (Cth) s 394 -> A person who has been dismissed may apply "
+    "to the Fair Work Commission for an order granting a remedy for unfair dismissal.",
+]
+# A backend passes the parity check with at least this rank agreement and the
+# same top document as fp32 torch
+PARITY_MIN_KENDALL_TAU = 0.8
+PARITY_MIN_TOP_K_AGREEMENT = 2 / 3
+
+
+def kendall_tau(a: List[float], b: List[float]) -> float:
+    """Kendall rank correlation of two score lists over the same items."""
+    concordant = discordant = 0
+    for i in range(len(a)):
+        for j in range(i + 1, len(a)):
+            sign = np.sign(a[i] - a[j]) * np.sign(b[i] - b[j])
+            concordant += sign > 0
+            discordant += sign < 0
+    pairs = len(a) * (len(a) - 1) / 2
+    return float((concordant - discordant) / pairs) if pairs else 1.0
+
+
+def parity(
+    reference: List[float],
+    candidate: List[float],
+    top_k: int = 3,
+    min_kendall_tau: float = PARITY_MIN_KENDALL_TAU,
+    min_top_k_agreement: float = PARITY_MIN_TOP_K_AGREEMENT,
+) -> Dict:
+    """Rank agreement of `candidate` scores with the `reference` scores."""
+    tau = kendall_tau(reference, candidate)
+    reference, candidate = np.asarray(reference), np.asarray(candidate)
+    top_k_agreement = (
+        len(set(np.argsort(-reference)[:top_k]) & set(np.argsort(-candidate)[:top_k]))
+        / top_k
+    )
+    same_top1 = int(reference.argmax()) == int(candidate.argmax())
+    return {
+        "kendall_tau": tau,
+        f"top{top_k}_agreement": top_k_agreement,
+        "same_top1": same_top1,
+        "max_abs_score_diff": float(np.max(np.abs(reference - candidate))),
+        "passed": tau >= min_kendall_tau
+        and top_k_agreement >= min_top_k_agreement
+        and same_top1,
+    }
+
+
+def compare_backends(
+    backends: List[str],
+    repeats: int = 20,
+    top_k: int = 3,
+    min_kendall_tau: float = PARITY_MIN_KENDALL_TAU,
+    min_top_k_agreement: float = PARITY_MIN_TOP_K_AGREEMENT,
+) -> List[Dict]:
+    """
+    Rank agreement of every reranker backend with the fp32 torch scores on the
+    fixed parity set, and its per-query rerank latency (no query cache).
+
+    Every backend is checked twice: encoding the documents live, and scoring
+    against the token embeddings the fp32 encoder wrote to a store, which is
+    how ingested chunks are reranked in production.
+    """
+    from src.embedding_store import TokenEmbeddingStore
+    from src.ranker import ReRanker
+
+    thresholds = {
+        "top_k": top_k,
+        "min_kendall_tau": min_kendall_tau,
+        "min_top_k_agreement": min_top_k_agreement,
+    }
+    reference, results = None, []
+    with tempfile.TemporaryDirectory() as store_path:
+        store = TokenEmbeddingStore(store_path)
+        document_ids = [f"parity-{i}" for i in range(len(PARITY_DOCUMENTS))]
+        stored_embeddings = None
+
+        for backend in ["torch", *[b for b in backends if b != "torch"]]:
+            reranker = ReRanker(backend=backend)
+            reranker.load()
+            if backend == "torch":
+                reference = reranker._calculate_sim(PARITY_QUERY, PARITY_DOCUMENTS)
+                store.add(zip(document_ids, reranker.encode_documents(PARITY_DOCUMENTS)))
+                stored_embeddings = [store.get(i) for i in document_ids]
+            live = reranker._calculate_sim(PARITY_QUERY, PARITY_DOCUMENTS)
+            stored = reranker._calculate_sim(
+                PARITY_QUERY, PARITY_DOCUMENTS, stored_embeddings
+            )
+
+            latencies = []
+            for _ in range(repeats):
+                reranker.query_cache = LRUCache(maxsize=1)
+                started = time.perf_counter()
+                reranker._calculate_sim(PARITY_QUERY, PARITY_DOCUMENTS)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            live_parity = parity(reference, live, **thresholds)
+            store_parity = parity(reference, stored, **thresholds)
+            results.append(
+                {
+                    "backend": backend,
+                    **live_parity,
+                    "store": store_parity,
+                    "passed": live_parity["passed"] and store_parity["passed"],
+                    "latency_ms": percentiles(latencies),
+                }
+            )
+    return [result for result in results if result["backend"] in backends]
+
+
+def run_config(
+    db, questions: List[Dict], top_k: int, initial_k: int, ef_search: int, rerank: bool
+) -> Dict:
+    """
+    Run every question through the two retrieval stages, timing each one.
+    A hit is a retrieved chunk from the same source version as the question.
+
+    The query embeddings are computed and the ColBERT weights loaded before
+    timing, so the ANN latency of every config (the first one included) is
+    the database search alone and the rerank latency excludes model loading.
+    """
+    hits, reciprocal_ranks = 0, []
+    ann_ms, rerank_ms, total_ms = [], [], []
+    for item in questions:
+        db.embeddings.embed_query(item["question"])
+    if rerank and questions:
+        db.reranker.load()
+        # Throwaway pass for the lazy first-call setup of the backend
+        db.reranker.rerank(
+            questions[0]["question"],
+            db.candidate_search(questions[0]["question"], initial_k, None, ef_search),
+            top_k,
+        )
+    # Rerank latency should include the query forward pass of every config
+    db.reranker.query_cache = LRUCache(maxsize=db.reranker.query_cache.maxsize)
+
+    for item in questions:
+        started = time.perf_counter()
+        candidates = db.candidate_search(
+            item["question"], initial_k=initial_k, ef_search=ef_search
+        )
+        ann_done = time.perf_counter()
+        if rerank:
+            results = [
+                doc for doc, _ in db.reranker.rerank(item["question"], candidates, top_k)
+            ]
+        else:
+            results = candidates[:top_k]
+        finished = time.perf_counter()
+
+        ann_ms.append((ann_done - started) * 1000)
+        rerank_ms.append((finished - ann_done) * 1000)
+        total_ms.append((finished - started) * 1000)
+
+        rank = next(
+            (
+                i + 1
+                for i, doc in enumerate(results)
+                if doc.metadata.get("version_id") == item["version_id"]
+            ),
+            None,
+        )
+        hits += rank is not None
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+
+    return {
+        "config": {
+            "top_k": top_k,
+            "initial_k": initial_k,
+            "ef_search": ef_search,
+            "rerank": rerank,
+        },
+        "queries": len(questions),
+        f"recall@{top_k}": hits / len(questions) if questions else None,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else None,
+        "latency_ms": {
+            "total": percentiles(total_ms),
+            "ann": percentiles(ann_ms),
+            "rerank": percentiles(rerank_ms),
+        },
+        "time_split": {
+            "ann": float(np.sum(ann_ms)) / max(float(np.sum(total_ms)), 1e-9),
+            "rerank": float(np.sum(rerank_ms)) / max(float(np.sum(total_ms)), 1e-9),
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline retrieval benchmark on open-australian-legal-qa."
+    )
+    parser.add_argument("--jsonl", help="Local JSON-lines slice of the dataset.")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[3])
+    parser.add_argument("--initial-k", type=int, nargs="+", default=[10])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[40, 100])
+    parser.add_argument(
+        "--rerank",
+        choices=["on", "off", "both"],
+        default="both",
+        help="Run with the ColBERT reranker, without it, or both.",
+    )
+    parser.add_argument(
+        "--search-mode", choices=["vector", "hybrid"], default="vector"
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        help="SQLite query-embedding cache, a warm cache lets runs go offline.",
+    )
+    parser.add_argument(
+        "--fake-embeddings",
+        action="store_true",
+        help="Use the deterministic local embedding stand-in (latency only).",
+    )
+    parser.add_argument(
+        "--reranker-backend", choices=["torch", "torch-int8", "onnx"], default=None
+    )
+    parser.add_argument(
+        "--compare-backends",
+        nargs="+",
+        choices=["torch", "torch-int8", "onnx"],
+        help="Only run the reranker backend parity/latency check on a fixed set.",
+    )
+    parser.add_argument(
+        "--min-kendall-tau", type=float, default=PARITY_MIN_KENDALL_TAU
+    )
+    parser.add_argument(
+        "--min-top-k-agreement", type=float, default=PARITY_MIN_TOP_K_AGREEMENT
+    )
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    if args.compare_backends:
+        results = compare_backends(
+            args.compare_backends,
+            min_kendall_tau=args.min_kendall_tau,
+            min_top_k_agreement=args.min_top_k_agreement,
+        )
+        for result in results:
+            print(
+                f"{result['backend']}: kendall_tau={result['kendall_tau']:.3f} "
+                f"top3_agreement={result['top3_agreement']:.2f} "
+                f"same_top1={result['same_top1']} "
+                f"store_kendall_tau={result['store']['kendall_tau']:.3f} "
+                f"store_same_top1={result['store']['same_top1']} "
+                f"p50={result['latency_ms']['p50']:.1f}ms "
+                f"p95={result['latency_ms']['p95']:.1f}ms "
+                f"({'ok' if result['passed'] else 'FAILED'})"
+            )
+        with open(args.output, "w") as file:
+            json.dump({"backends": results}, file, indent=2)
+        print(f"Results written to {args.output}")
+        sys.exit(0 if all(result["passed"] for result in results) else 1)
+
+    from src.database import VectorDB
+
+    embeddings = None
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        embeddings = DeterministicFakeEmbedding(size=VectorDB.EMBEDDING_DIMENSIONS)
+
+    db = VectorDB(
+        embeddings=embeddings,
+        query_cache_path=args.embedding_cache,
+        search_mode=args.search_mode,
+        reranker_backend=args.reranker_backend,
+    )
+    questions = load_questions(args.jsonl, args.limit)
+    rerank_modes = {"on": [True], "off": [False], "both": [True, False]}[args.rerank]
+
+    results = []
+    for top_k, initial_k, ef_search, rerank in product(
+        args.top_k, args.initial_k, args.ef_search, rerank_modes
+    ):
+        result = run_config(db, questions, top_k, initial_k, ef_search, rerank)
+        results.append(result)
+        print(
+            f"top_k={top_k} initial_k={initial_k} ef_search={ef_search} "
+            f"rerank={rerank}: recall@{top_k}={result[f'recall@{top_k}']:.3f} "
+            f"mrr={result['mrr']:.3f} "
+            f"p50={result['latency_ms']['total']['p50']:.1f}ms "
+            f"p95={result['latency_ms']['total']['p95']:.1f}ms"
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(
+            {
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "embedding_dimensions": VectorDB.EMBEDDING_DIMENSIONS,
+                "fake_embeddings": args.fake_embeddings,
+                "search_mode": args.search_mode,
+                "reranker_backend": db.reranker.backend,
+                "cache_stats": db.cache_stats(),
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from collections import Counter
+from typing import Optional
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain.schema import HumanMessage
+from langgraph.graph import END
+from src.metrics import metrics
+import threading
+import time
+import os
+
+BUDGET_EXHAUSTED = "budget_exhausted"
+
+# Verdicts that count towards the score of a response, with their passing value
+VERDICTS = {"hallucination": False, "quality": True, "compliance": True}
+
+
+class RequestBudget(BaseCallbackHandler):
+    """
+    Per-request limits on the graph: iterations of every retry cycle, a
+    wall-clock deadline and the total LLM tokens.
+
+    The budget is passed in the graph inputs as `budget` and registered as a
+    callback (see `budget_config`) so every LLM call made by the nodes is
+    counted. The routing functions consult it before following an edge, and
+    once it runs out the graph exits through the `budget_exhausted` node with
+    the best graded response seen so far.
+    """
+
+    DEFAULT_MAX_ITERATIONS = int(os.getenv("BUDGET_MAX_ITERATIONS", 2))
+    DEFAULT_DEADLINE_SECONDS = float(os.getenv("BUDGET_DEADLINE_SECONDS", 120))
+    DEFAULT_MAX_TOKENS = int(os.getenv("BUDGET_MAX_TOKENS", 60000))
+
+    def __init__(
+        self,
+        max_iterations: int = DEFAULT_MAX_ITERATIONS,
+        deadline_seconds: Optional[float] = DEFAULT_DEADLINE_SECONDS,
+        max_tokens: Optional[int] = DEFAULT_MAX_TOKENS,
+    ):
+        self.max_iterations = max_iterations
+        self.deadline = (
+            time.monotonic() + deadline_seconds if deadline_seconds else None
+        )
+        self.max_tokens = max_tokens
+        self.iterations = Counter()
+        self.tokens = 0
+        self.reason = None
+        self.best_response = None
+        self._best_score = -1
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                tokens += (usage or {}).get("total_tokens", 0)
+        if not tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            tokens = usage.get("total_tokens", 0)
+        with self._lock:
+            self.tokens += tokens
+
+    def remaining_seconds(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def exhausted(self) -> Optional[str]:
+        """Reason the deadline or the token budget ran out, if it did."""
+        if self.reason is None:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                self.reason = "deadline"
+            elif self.max_tokens is not None and self.tokens >= self.max_tokens:
+                self.reason = "tokens"
+        return self.reason
+
+    def take_iteration(self, cycle: str) -> bool:
+        """Count one more pass through `cycle`, False once it has had its share."""
+        with self._lock:
+            if self.iterations[cycle] >= self.max_iterations:
+                self.reason = self.reason or f"iterations:{cycle}"
+                return False
+            self.iterations[cycle] += 1
+        metrics.inc("cycle_iterations", cycle=cycle)
+        return True
+
+    def record(self, state, verdicts) -> None:
+        """Remember the current response if it passed the most of `verdicts` so far."""
+        if state.get("response") is None:
+            return
+        score = sum(state.get(key) == VERDICTS[key] for key in verdicts)
+        with self._lock:
+            if score >= self._best_score:
+                self._best_score = score
+                self.best_response = state["response"]
+
+    def stats(self) -> dict:
+        return {
+            "iterations": dict(self.iterations),
+            "tokens": self.tokens,
+            "remaining_seconds": self.remaining_seconds(),
+            "reason": self.reason,
+        }
+
+
+def budget_config(budget: Optional[RequestBudget], config=None) -> dict:
+    """Add `budget` to the callbacks of a run config."""
+    config = dict(config or {})
+    if budget is not None:
+        config["callbacks"] = [*(config.get("callbacks") or []), budget]
+    return config
+
+
+def bounded_route(route, path_map, cycles=None, verdicts=()):
+    """
+    Wrap a routing function with the request budget of the state.
+
+    `cycles` maps the route outcomes that go back to an earlier node to the
+    name of the cycle they belong to, each of which gets `max_iterations`
+    passes. Any edge other than the one to END is also refused once the
+    deadline or token budget has run out. `verdicts` are the grader keys
+    already decided at this point, used to score the current response.
+    Without a budget in the state the route is unchanged.
+    """
+    cycles = cycles or {}
+
+    def bounded(state):
+        outcome = route(state)
+        budget = state.get("budget")
+        if budget is None or path_map[outcome] == END:
+            return outcome
+        if verdicts:
+            budget.record(state, verdicts)
+        if outcome in cycles and not budget.take_iteration(cycles[outcome]):
+            return BUDGET_EXHAUSTED
+        if budget.exhausted():
+            return BUDGET_EXHAUSTED
+        return outcome
+
+    return bounded
+
+
+def budget_exhausted_node(state):
+    budget = state["budget"]
+    metrics.inc("budget_exhausted", reason=budget.exhausted())
+    print(f"Request budget exhausted ({budget.exhausted()}): {budget.stats()}")
+    state["budget_exhausted"] = True
+    state["response"] = budget.best_response or state.get("response") or HumanMessage(
+        content="I could not complete this request within its time and cost limits."
+    )
+    return state
@@ -0,0 +1,205 @@
+from collections import OrderedDict
+from typing import Any, List, Optional
+import numpy as np
+import threading
+import hashlib
+import pickle
+import sqlite3
+import time
+
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially different rewrites share a cache entry."""
+    return " ".join(text.split())
+
+
+def make_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(
+        f"{model_name}\x00{normalize_text(text)}".encode("utf-8")
+    ).hexdigest()
+
+
+class LRUCache:
+    """
+    Size-bounded, thread-safe LRU cache with an optional persistent SQLite tier.
+
+    Lookups go to memory first, then to disk (promoting the entry back into
+    memory). Writes go to both tiers. `hits`, `misses` and `disk_hits` count
+    lookups so the saved round trips can be reported.
+    """
+
+    def __init__(self, maxsize: int = 1024, path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.path = path
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT value FROM cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value = pickle.loads(row[0])
+                    self._put(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._put(key, value)
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+                    (key, pickle.dumps(value)),
+                )
+                self._conn.commit()
+
+    def _put(self, key: str, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class SemanticAnswerCache:
+    """
+    Persistent (SQLite) cache of final answers keyed by query embedding.
+
+    A lookup hits when a stored query with the same user context hash and
+    corpus version has a cosine similarity of at least `threshold` with the
+    new query. Entries expire after `ttl` seconds, the least recently used
+    entries are evicted above `max_entries`, and entries of any other corpus
+    version are dropped as soon as the corpus version changes.
+    """
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        threshold: float = 0.95,
+        ttl: Optional[float] = 24 * 3600,
+        max_entries: int = 1000,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, context_hash TEXT, corpus_version TEXT, "
+            "embedding BLOB, query TEXT, answer TEXT, "
+            "created_at REAL, last_access REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def context_hash(user_context: Optional[str]) -> str:
+        return hashlib.sha256((user_context or "").encode("utf-8")).hexdigest()
+
+    def _expire(self, corpus_version: str) -> None:
+        self._conn.execute(
+            "DELETE FROM answers WHERE corpus_version != ?", (corpus_version,)
+        )
+        if self.ttl:
+            self._conn.execute(
+                "DELETE FROM answers WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+
+    def lookup(
+        self, query_embedding: List[float], context_hash: str, corpus_version: str
+    ) -> Optional[str]:
+        with self._lock:
+            self._expire(corpus_version)
+            rows = self._conn.execute(
+                "SELECT id, embedding, answer FROM answers "
+                "WHERE context_hash = ? AND corpus_version = ?",
+                (context_hash, corpus_version),
+            ).fetchall()
+            if rows:
+                matrix = np.stack([np.frombuffer(row[1], dtype=np.float32) for row in rows])
+                query = np.asarray(query_embedding, dtype=np.float32)
+                similarities = matrix @ query / (
+                    np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12
+                )
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._conn.execute(
+                        "UPDATE answers SET last_access = ? WHERE id = ?",
+                        (time.time(), rows[best][0]),
+                    )
+                    self._conn.commit()
+                    self.hits += 1
+                    return rows[best][2]
+            self._conn.commit()
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        query: str,
+        query_embedding: List[float],
+        context_hash: str,
+        corpus_version: str,
+        answer: str,
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO answers (context_hash, corpus_version, embedding, query, "
+                "answer, created_at, last_access) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    context_hash,
+                    corpus_version,
+                    np.asarray(query_embedding, dtype=np.float32).tobytes(),
+                    query,
+                    answer,
+                    now,
+                    now,
+                ),
+            )
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN ("
+                "SELECT id FROM answers ORDER BY last_access DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,151 @@
+from typing import Dict, Iterable, List, Set, Tuple
+from langchain_core.documents import Document
+import sqlalchemy
+import re
+
+# [2001] NSWCCA 334, [1992] HCA 23
+NEUTRAL_CITATION = re.compile(r"\[(\d{4})\]\s*([A-Za-z][A-Za-z]*)\s*(\d+)")
+# R v NGUYEN, Mabo v Queensland (No 2), Smith v. Jones Pty Ltd
+PARTY_NAMES = re.compile(
+    r"\b([A-Z][\w'&.-]*(?:\s+(?:[A-Z][\w'&.-]*|of|and|the|\(No\s*\d+\)))*)"
+    r"\s+v\.?\s+"
+    r"([A-Z][\w'&.-]*(?:\s+(?:[A-Z][\w'&.-]*|of|and|the|\(No\s*\d+\)))*)"
+)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def neutral_citation_keys(text: str) -> List[str]:
+    return [
+        f"ncit:{year} {court.upper()} {number}"
+        for year, court, number in NEUTRAL_CITATION.findall(text)
+    ]
+
+
+def party_name_keys(text: str) -> List[str]:
+    return [
+        f"party:{_normalize(first)} v {_normalize(second)}"
+        for first, second in PARTY_NAMES.findall(text)
+    ]
+
+
+def citation_keys(citation: str) -> List[str]:
+    """Lookup keys of a stored `citation` metadata string, e.g. 'R v NGUYEN [2001] NSWCCA 334'."""
+    keys = neutral_citation_keys(citation)
+    # The party names are whatever precedes the neutral citation
+    parties = NEUTRAL_CITATION.split(citation, maxsplit=1)[0]
+    keys.extend(party_name_keys(parties))
+    return list(dict.fromkeys(keys))
+
+
+def extract_query_citation_keys(query: str) -> List[str]:
+    """
+    Citation keys mentioned in a query. Neutral citations are unambiguous, so
+    party names are only used when the query has none.
+    """
+    return neutral_citation_keys(query) or party_name_keys(query)
+
+
+class CitationIndex:
+    """
+    Lookup table from normalised citation keys (neutral citations and party
+    names) to chunk ids, filled at ingest from the chunk `citation` metadata.
+
+    The table is created on first use, so a VectorDB that never called
+    `enable_citation_indexing` can still add and look up citations.
+    """
+
+    TABLE_NAME = "louis_citation_index"
+
+    def __init__(self, session_maker, collection_name: str):
+        self.session_maker = session_maker
+        self.collection_name = collection_name
+        self._table_ready = False
+
+    def create_table(self) -> None:
+        if self._table_ready:
+            return
+        with self.session_maker() as session:
+            session.execute(
+                sqlalchemy.text(
+                    f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} ("
+                    "key TEXT NOT NULL, "
+                    "chunk_id TEXT NOT NULL, "
+                    "collection TEXT NOT NULL, "
+                    "PRIMARY KEY (collection, key, chunk_id)"
+                    ");"
+                )
+            )
+            session.commit()
+        self._table_ready = True
+
+    def add(self, documents: Iterable[Document]) -> int:
+        rows = [
+            {"key": key, "chunk_id": doc.metadata["id"], "collection": self.collection_name}
+            for doc in documents
+            if doc.metadata.get("citation")
+            for key in citation_keys(doc.metadata["citation"])
+        ]
+        if not rows:
+            return 0
+        self.create_table()
+        with self.session_maker() as session:
+            session.execute(
+                sqlalchemy.text(
+                    f"INSERT INTO {self.TABLE_NAME} (key, chunk_id, collection) "
+                    "VALUES (:key, :chunk_id, :collection) ON CONFLICT DO NOTHING"
+                ),
+                rows,
+            )
+            session.commit()
+        return len(rows)
+
+    def indexed_ids(self) -> Set[str]:
+        """Ids of the chunks this collection already has citation rows for."""
+        self.create_table()
+        with self.session_maker() as session:
+            rows = session.execute(
+                sqlalchemy.text(
+                    f"SELECT DISTINCT chunk_id FROM {self.TABLE_NAME} "
+                    "WHERE collection = :collection"
+                ),
+                {"collection": self.collection_name},
+            )
+            return {row[0] for row in rows}
+
+    def lookup(
+        self, keys: List[str], excluded_ids: Set[str] = None
+    ) -> Tuple[List[Document], Dict[str, int]]:
+        """
+        Fetch the chunks stored under any of `keys`, straight from
+        langchain_pg_embedding. Returns the documents and the number of
+        chunks found per key.
+        """
+        self.create_table()
+        query = sqlalchemy.text(
+            "SELECT ci.key, e.id, e.document, e.cmetadata "
+            f"FROM {self.TABLE_NAME} ci "
+            "JOIN langchain_pg_embedding e ON e.id = ci.chunk_id "
+            "WHERE ci.collection = :collection AND ci.key = ANY(:keys) "
+            "AND NOT (e.id = ANY(:excluded_ids))"
+        )
+        with self.session_maker() as session:
+            rows = session.execute(
+                query,
+                {
+                    "collection": self.collection_name,
+                    "keys": keys,
+                    "excluded_ids": sorted(excluded_ids or []),
+                },
+            ).fetchall()
+
+        documents, hits = {}, {key: 0 for key in keys}
+        for row in rows:
+            hits[row.key] += 1
+            documents.setdefault(
+                row.id,
+                Document(id=row.id, page_content=row.document, metadata=row.cmetadata),
+            )
+        return list(documents.values()), hits
@@ -0,0 +1,153 @@
+from typing import Dict, List, Optional, Tuple
+import re
+import os
+
+from src.citations import citation_keys, neutral_citation_keys, party_name_keys
+from src.utils import count_tokens
+
+# gpt-4o-mini context window, minus room for the completion
+MODEL_CONTEXT_WINDOW = int(os.getenv("MODEL_CONTEXT_WINDOW", 128000))
+RESPONSE_RESERVE_TOKENS = 4096
+# Prompt instructions, query and answer outside of the assembled contexts
+PROMPT_OVERHEAD_TOKENS = 4096
+
+# Token budget (retrieved legal context, user uploaded context) of every prompt.
+# The graders and the completeness check see as much retrieved context as the
+# response is built from.
+CONTEXT_BUDGETS: Dict[str, Tuple[int, int]] = {
+    "complexity_ranking": (0, 1500),
+    "retrieval_prompt": (0, 1500),
+    "completeness": (6000, 1500),
+    "response_constructor": (6000, 4000),
+    "grader_hallucination": (6000, 2000),
+    "verify_hallucination": (6000, 2000),
+}
+# Nodes that grade the response against the documents it was built from
+RESPONSE_GRADERS = {"grader_hallucination", "verify_hallucination"}
+
+
+def document_key(doc) -> str:
+    return doc.metadata.get("id") or doc.id or doc.page_content
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    return text[: len(text) * max_tokens // tokens]
+
+
+def _cited_keys(text: str) -> set:
+    return set(neutral_citation_keys(text)) | set(party_name_keys(text))
+
+
+def rank_documents(
+    documents: List,
+    answer: Optional[str] = None,
+    retrieval_ranks: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> List:
+    """
+    Most relevant first: passages cited by `answer` (if given), then the
+    retrieval passes interleaved by rank (the best document of every pass,
+    then the second, ...).
+
+    `retrieval_ranks` maps a document key to its (rank, pass) at retrieval.
+    Reranker scores of different passes are computed against different
+    queries and are not comparable, so only the rank within a pass is used.
+    Documents without an entry keep their list order, as the first pass.
+    """
+    cited = _cited_keys(answer) if answer else set()
+    retrieval_ranks = retrieval_ranks or {}
+
+    def key(position_doc):
+        position, doc = position_doc
+        is_cited = bool(cited) and bool(
+            cited & set(citation_keys(doc.metadata.get("citation") or ""))
+        )
+        return (not is_cited, *retrieval_ranks.get(document_key(doc), (position, 0)))
+
+    return [doc for _, doc in sorted(enumerate(documents), key=key)]
+
+
+def select_documents(
+    documents: List,
+    max_tokens: int,
+    answer: Optional[str] = None,
+    retrieval_ranks: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> List:
+    """The highest ranked documents that fit into `max_tokens`."""
+    selected, used = [], 0
+    for doc in rank_documents(documents, answer, retrieval_ranks):
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > max_tokens:
+            continue
+        selected.append(doc)
+        used += tokens
+    return selected
+
+
+def select_passages(text: str, max_tokens: int, query: str) -> str:
+    """
+    `text` itself when it fits, otherwise the paragraphs sharing the most words
+    with `query` that fit into `max_tokens`, in their original order.
+    """
+    if not text or count_tokens(text) <= max_tokens:
+        return text
+    query_words = set(re.findall(r"\w+", query.lower()))
+    paragraphs = [p for p in text.split("\n\n") if p.strip()]
+    ranked = sorted(
+        range(len(paragraphs)),
+        key=lambda i: len(query_words & set(re.findall(r"\w+", paragraphs[i].lower()))),
+        reverse=True,
+    )
+    chosen, used = set(), 0
+    for i in ranked:
+        tokens = count_tokens(paragraphs[i])
+        if used + tokens <= max_tokens:
+            chosen.add(i)
+            used += tokens
+    if not chosen:
+        return truncate_to_tokens(paragraphs[ranked[0]], max_tokens)
+    return "\n\n".join(paragraphs[i] for i in sorted(chosen))
+
+
+def _budgets(state, node: str) -> Tuple[int, int]:
+    system_budget, user_budget = (state.get("context_budgets") or {}).get(
+        node, CONTEXT_BUDGETS[node]
+    )
+    # Never let the contexts push the prompt past the model window
+    available = MODEL_CONTEXT_WINDOW - RESPONSE_RESERVE_TOKENS - PROMPT_OVERHEAD_TOKENS
+    if system_budget + user_budget > available:
+        scale = available / (system_budget + user_budget)
+        system_budget, user_budget = int(system_budget * scale), int(user_budget * scale)
+    return system_budget, user_budget
+
+
+def assemble_context(state, node: str, answer: Optional[str] = None):
+    """
+    Retrieved legal context, user uploaded context and the documents behind
+    the former for the prompt of `node`, each within the node's token budget.
+
+    Retrieved documents are ranked within their retrieval pass, with the
+    passages cited by `answer` first for the graders. The response graders only get the
+    documents the response prompt was given (`response_doc_ids`). The user
+    context is cut down to the paragraphs closest to the query when it is over
+    budget.
+    """
+    system_budget, user_budget = _budgets(state, node)
+    documents = []
+    candidates = state.get("retrieved_docs") or []
+    if node in RESPONSE_GRADERS and state.get("response_doc_ids") is not None:
+        response_doc_ids = set(state["response_doc_ids"])
+        candidates = [doc for doc in candidates if document_key(doc) in response_doc_ids]
+    if system_budget and candidates:
+        documents = select_documents(
+            candidates, system_budget, answer, state.get("retrieval_ranks")
+        )
+    system_context = "\n\n".join(f"- {doc.page_content}" for doc in documents)
+    if not documents and system_budget and state.get("system_context"):
+        system_context = truncate_to_tokens(state["system_context"], system_budget)
+    user_context = select_passages(
+        state.get("user_context") or "", user_budget, state["query"]
+    )
+    return system_context or None, user_context or None, documents
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from typing import List, Tuple
+import numpy as np
+import hashlib
+import re
+
+
+class MinHashDeduplicator:
+    """
+    Streaming exact + near-duplicate detector for chunk text.
+
+    Exact duplicates are caught by a hash of the whitespace/case normalised
+    text. Near-duplicates are found with MinHash signatures over word
+    shingles and LSH banding: only texts sharing a band bucket are compared,
+    and a text is a near-duplicate when the estimated Jaccard similarity to
+    one of them reaches `threshold`.
+    """
+
+    _PRIME = (1 << 31) - 1
+
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 5,
+        seed: int = 1,
+    ):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, self._PRIME, size=num_perm, dtype=np.uint64)
+
+        self._exact = set()
+        self._signatures: List[np.ndarray] = []
+        self._buckets = defaultdict(list)
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def _shingles(self, text: str) -> set:
+        tokens = re.findall(r"\w+", text.lower())
+        if len(tokens) < self.shingle_size:
+            return {" ".join(tokens)}
+        return {
+            " ".join(tokens[i : i + self.shingle_size])
+            for i in range(len(tokens) - self.shingle_size + 1)
+        }
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (
+                int.from_bytes(
+                    hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(),
+                    "little",
+                )
+                % self._PRIME
+                for shingle in self._shingles(text)
+            ),
+            dtype=np.uint64,
+        )
+        # [num_perm, num_shingles] universal hashes, min over shingles
+        permuted = (np.outer(self._a, hashes) + self._b[:, None]) % self._PRIME
+        return permuted.min(axis=1)
+
+    def is_duplicate(self, text: str) -> bool:
+        """Check `text` against everything seen so far and remember it if new."""
+        digest = hashlib.sha256(" ".join(text.lower().split()).encode("utf-8")).digest()
+        if digest in self._exact:
+            self.exact_duplicates += 1
+            return True
+
+        signature = self.signature(text)
+        bands = [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+        candidates = {index for key in bands for index in self._buckets.get(key, ())}
+        for index in candidates:
+            if np.mean(self._signatures[index] == signature) >= self.threshold:
+                self.near_duplicates += 1
+                return True
+
+        self._exact.add(digest)
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for key in bands:
+            self._buckets[key].append(index)
+        return False
+
+    @property
+    def skipped(self) -> int:
+        return self.exact_duplicates + self.near_duplicates
+
+
+def deduplicate(documents, threshold: float = 0.8) -> Tuple[list, MinHashDeduplicator]:
+    """Drop exact and near-duplicate documents, keeping the first occurrence."""
+    deduplicator = MinHashDeduplicator(threshold=threshold)
+    kept = [doc for doc in documents if not deduplicator.is_duplicate(doc.page_content)]
+    return kept, deduplicator
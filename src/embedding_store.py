@@ -0,0 +1,128 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import json
+import os
+
+
+class TokenEmbeddingStore:
+    """
+    On-disk store of per-chunk ColBERT token embeddings, keyed by the chunk `id`.
+
+    Layout of the store directory:
+        embeddings.bin  all token rows of every chunk, back to back, as raw fp16
+        index.json      {"dim": ..., "entries": {chunk_id: [row_offset, num_rows]}}
+
+    The rows are read through a numpy memmap, so opening the store is cheap and
+    only the matrices of the reranked candidates are paged in.
+    """
+
+    DTYPE = np.float16
+    EMBEDDINGS_FILE = "embeddings.bin"
+    INDEX_FILE = "index.json"
+
+    def __init__(self, path: str = "data/colbert_store"):
+        self.path = path
+        self.dim: Optional[int] = None
+        self.entries: Dict[str, Tuple[int, int]] = {}
+        self._rows = 0
+        self._matrix = None
+
+        if os.path.exists(self._index_path):
+            with open(self._index_path, "r") as file:
+                index = json.load(file)
+            self.dim = index["dim"]
+            self.entries = {k: tuple(v) for k, v in index["entries"].items()}
+            self._rows = index["rows"]
+
+    @property
+    def _index_path(self) -> str:
+        return os.path.join(self.path, self.INDEX_FILE)
+
+    @property
+    def _embeddings_path(self) -> str:
+        return os.path.join(self.path, self.EMBEDDINGS_FILE)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _open(self):
+        if self._matrix is None and self._rows:
+            self._matrix = np.memmap(
+                self._embeddings_path,
+                dtype=self.DTYPE,
+                mode="r",
+                shape=(self._rows, self.dim),
+            )
+        return self._matrix
+
+    def get(self, chunk_id: Optional[str]) -> Optional[np.ndarray]:
+        """Return the [num_tokens, dim] fp16 matrix of a chunk, or None if not stored."""
+        if chunk_id not in self.entries:
+            return None
+        offset, length = self.entries[chunk_id]
+        return self._open()[offset : offset + length]
+
+    def add(self, items: Iterable[Tuple[str, np.ndarray]]) -> int:
+        """
+        Append token embedding matrices to the store. Chunks already present
+        are skipped. Returns the number of chunks written.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        # Drop rows of an interrupted write that never made it into the index,
+        # so appended rows start exactly at the recorded offset
+        indexed_bytes = self._rows * (self.dim or 0) * np.dtype(self.DTYPE).itemsize
+        if (
+            os.path.exists(self._embeddings_path)
+            and os.path.getsize(self._embeddings_path) > indexed_bytes
+        ):
+            os.truncate(self._embeddings_path, indexed_bytes)
+        written = 0
+        with open(self._embeddings_path, "ab") as file:
+            for chunk_id, embedding in items:
+                if chunk_id in self.entries:
+                    continue
+                embedding = np.ascontiguousarray(embedding, dtype=self.DTYPE)
+                if self.dim is None:
+                    self.dim = embedding.shape[1]
+                assert embedding.shape[1] == self.dim, "embedding dim mismatch"
+                file.write(embedding.tobytes())
+                self.entries[chunk_id] = (self._rows, embedding.shape[0])
+                self._rows += embedding.shape[0]
+                written += 1
+
+        self._save_index()
+        # The memmap was sized for the previous file length
+        self._matrix = None
+        return written
+
+    def remove(self, chunk_ids: Iterable[str]) -> int:
+        """
+        Forget the entries of deleted chunks. Their rows stay in the file
+        unreferenced. Returns the number of entries removed.
+        """
+        removed = 0
+        for chunk_id in chunk_ids:
+            if self.entries.pop(chunk_id, None) is not None:
+                removed += 1
+        if removed:
+            self._save_index()
+        return removed
+
+    def missing(self, chunk_ids: Iterable[str]) -> List[str]:
+        return [chunk_id for chunk_id in chunk_ids if chunk_id not in self.entries]
+
+    def _save_index(self) -> None:
+        tmp_path = self._index_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {
+                    "dim": self.dim,
+                    "rows": self._rows,
+                    "entries": {k: list(v) for k, v in self.entries.items()},
+                },
+                file,
+            )
+        os.replace(tmp_path, self._index_path)
@@ -0,0 +1,354 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from langchain_core.documents import Document
+from src.dedupe import MinHashDeduplicator
+import argparse
+import threading
+import hashlib
+import json
+import time
+import os
+
+DATASET_NAME = "isaacus/open-australian-legal-qa"
+
+
+class RateLimiter:
+    """Spaces out calls so no more than `requests_per_minute` start per minute."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class IngestCheckpoint:
+    """Number of source rows fully written, persisted as JSON after every batch."""
+
+    def __init__(self, path: Optional[str] = "data/ingest_checkpoint.json"):
+        self.path = path
+        self.rows_done = 0
+        if path and os.path.exists(path):
+            with open(path, "r") as file:
+                self.rows_done = json.load(file)["rows_done"]
+
+    def save(self, rows_done: int) -> None:
+        self.rows_done = rows_done
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"rows_done": rows_done}, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.rows_done = 0
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def iter_corpus_rows(
+    dataset_name: str = DATASET_NAME, split: str = "train", jsonl_path: str = None
+) -> Iterator[Dict]:
+    """
+    Yield dataset rows one at a time, either streamed from the Hugging Face hub
+    or read from a local JSON-lines slice of the dataset.
+    """
+    if jsonl_path:
+        with open(jsonl_path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    from datasets import load_dataset
+
+    yield from load_dataset(dataset_name, split=split, streaming=True)
+
+
+def chunk_id(text: str, version_id: str) -> str:
+    """Content-addressed id, stable for the same chunk text of the same source version."""
+    return hashlib.sha256(f"{version_id}\x00{text}".encode("utf-8")).hexdigest()
+
+
+def row_to_document(row: Dict) -> Document:
+    source = row["source"]
+    return Document(
+        page_content=f'{source["citation"]} -> {source["text"]}',
+        metadata={
+            "version_id": source["version_id"],
+            "type": source["type"],
+            "jurisdiction": source["jurisdiction"],
+            "source": source["source"],
+            "citation": source["citation"],
+            "url": source["url"],
+        },
+    )
+
+
+class IngestPipeline:
+    """
+    Streaming corpus loader: rows are read lazily, chunked, embedded in batches
+    by a pool of concurrent (rate limited) requests, and written in order with
+    one multi-row insert per batch. Batches always end on a row boundary, so
+    the checkpoint can record how many rows are safely stored and an
+    interrupted load resumes from there.
+
+    Chunk ids are content addressed. In `incremental` mode the ids already in
+    the collection are loaded up front: only new or changed chunks are
+    embedded and written, and with `prune` the rows no longer produced by the
+    dataset are deleted at the end of a full pass.
+
+    Chunks whose text is an exact or near duplicate of an earlier chunk in the
+    run are dropped before embedding (see MinHashDeduplicator). A resumed run
+    first seeds the deduplicator with the chunks already written, so the rows
+    after the checkpoint are deduplicated against the whole load.
+    """
+
+    def __init__(
+        self,
+        db,
+        embeddings=None,
+        batch_size: int = 256,
+        max_concurrency: int = 4,
+        requests_per_minute: Optional[float] = None,
+        checkpoint: Optional[IngestCheckpoint] = None,
+        build_token_store: bool = True,
+        incremental: bool = False,
+        prune: bool = False,
+        dedupe_threshold: Optional[float] = 0.8,
+    ):
+        self.db = db
+        self.embeddings = embeddings or db.embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.checkpoint = checkpoint or IngestCheckpoint(None)
+        self.build_token_store = build_token_store
+        from langchain_text_splitters.markdown import MarkdownTextSplitter
+
+        self.splitter = MarkdownTextSplitter()
+        self.incremental = incremental
+        self.prune = prune
+        self.existing_ids: Set[str] = set()
+        self.indexed_ids: Set[str] = set()
+        self.seen_ids: Set[str] = set()
+        self.skipped = 0
+        self._citation_backfill: List[Document] = []
+        self.deduplicator = (
+            MinHashDeduplicator(threshold=dedupe_threshold)
+            if dedupe_threshold
+            else None
+        )
+
+    def _chunks(self, row: Dict) -> List[Document]:
+        """Split a row and give every chunk its content-addressed id."""
+        chunks = []
+        for chunk in self.splitter.split_documents([row_to_document(row)]):
+            chunk.metadata["id"] = chunk_id(
+                chunk.page_content, chunk.metadata["version_id"]
+            )
+            # The QA dataset repeats sources, every chunk is written once
+            if chunk.metadata["id"] in self.seen_ids:
+                continue
+            self.seen_ids.add(chunk.metadata["id"])
+            if self.deduplicator and self.deduplicator.is_duplicate(
+                chunk.page_content
+            ):
+                continue
+            if chunk.metadata["id"] in self.existing_ids:
+                self.skipped += 1
+                if (
+                    chunk.metadata.get("citation")
+                    and chunk.metadata["id"] not in self.indexed_ids
+                ):
+                    self._backfill_citations(chunk)
+                continue
+            chunks.append(chunk)
+        return chunks
+
+    def _seed_deduplicator(self) -> None:
+        """Register the chunks written before the checkpoint with the deduplicator."""
+        exact, near = self.deduplicator.exact_duplicates, self.deduplicator.near_duplicates
+        seeded = 0
+        for text in self.db.iter_texts():
+            self.deduplicator.is_duplicate(text)
+            seeded += 1
+        # Only duplicates among the new rows count as skipped
+        self.deduplicator.exact_duplicates, self.deduplicator.near_duplicates = exact, near
+        print(f"Seeded the deduplicator with {seeded} stored chunks.")
+
+    def _backfill_citations(self, chunk: Optional[Document] = None) -> None:
+        """Index the citations of unchanged chunks the citation index has no rows for yet."""
+        if chunk is not None:
+            self._citation_backfill.append(chunk)
+        if self._citation_backfill and (
+            chunk is None or len(self._citation_backfill) >= self.batch_size
+        ):
+            self.db.citation_index.add(self._citation_backfill)
+            self._citation_backfill = []
+
+    def _batches(self, rows: Iterable[Dict]) -> Iterator[tuple]:
+        """Yield (rows_done_after_batch, chunks) with chunks grouped by whole rows."""
+        row_index = self.checkpoint.rows_done
+        chunks: List[Document] = []
+        for row in islice(rows, self.checkpoint.rows_done, None):
+            chunks.extend(self._chunks(row))
+            row_index += 1
+            if len(chunks) >= self.batch_size:
+                yield row_index, chunks
+                chunks = []
+        if chunks:
+            yield row_index, chunks
+
+    def _embed(self, chunks: List[Document]) -> List[List[float]]:
+        self.rate_limiter.acquire()
+        return self.embeddings.embed_documents([doc.page_content for doc in chunks])
+
+    def _write(self, chunks: List[Document], embeddings: List[List[float]]) -> None:
+        self.db.vector_store.add_embeddings(
+            texts=[doc.page_content for doc in chunks],
+            embeddings=embeddings,
+            metadatas=[doc.metadata for doc in chunks],
+            ids=[doc.metadata["id"] for doc in chunks],
+        )
+        self.db.citation_index.add(chunks)
+        if self.build_token_store:
+            self.db.build_token_embedding_store(chunks)
+
+    def run(self, rows: Iterable[Dict]) -> int:
+        if self.incremental:
+            # Unchanged chunks are skipped by id, so a full pass is cheap
+            self.checkpoint.clear()
+            self.existing_ids = self.db.existing_ids()
+            print(f"Found {len(self.existing_ids)} chunks already stored.")
+            self.indexed_ids = self.db.citation_index.indexed_ids()
+        if self.checkpoint.rows_done:
+            print(f"Resuming ingest after row {self.checkpoint.rows_done}.")
+            if self.deduplicator:
+                self._seed_deduplicator()
+
+        started = time.monotonic()
+        written = 0
+        pending = deque()
+
+        def drain_one():
+            nonlocal written
+            rows_done, chunks, future = pending.popleft()
+            self._write(chunks, future.result())
+            self.checkpoint.save(rows_done)
+            written += len(chunks)
+            elapsed = time.monotonic() - started
+            print(
+                f"Ingested {rows_done} rows, {written} chunks "
+                f"({written / elapsed:.1f} chunks/s)."
+            )
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            for rows_done, chunks in self._batches(rows):
+                pending.append((rows_done, chunks, executor.submit(self._embed, chunks)))
+                # Keep at most `max_concurrency` embedding requests in flight
+                if len(pending) >= self.max_concurrency:
+                    drain_one()
+            while pending:
+                drain_one()
+        self._backfill_citations()
+        if written:
+            self.db.bump_corpus_version()
+
+        if self.deduplicator:
+            print(
+                f"Skipped {self.deduplicator.skipped} duplicate chunks "
+                f"({self.deduplicator.exact_duplicates} exact, "
+                f"{self.deduplicator.near_duplicates} near)."
+            )
+        if self.incremental:
+            print(f"Skipped {self.skipped} unchanged chunks.")
+        if self.incremental and self.prune:
+            stale_ids = self.existing_ids - self.seen_ids
+            self.db.delete_documents(sorted(stale_ids))
+            print(f"Deleted {len(stale_ids)} stale chunks.")
+
+        return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stream the open-australian-legal-qa corpus into the vector store."
+    )
+    parser.add_argument("--jsonl", help="Read rows from a local JSON-lines slice.")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=None)
+    parser.add_argument("--checkpoint", default="data/ingest_checkpoint.json")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the checkpoint and start over."
+    )
+    parser.add_argument(
+        "--fake-embeddings",
+        action="store_true",
+        help="Use a deterministic local embedding stand-in instead of OpenAI.",
+    )
+    parser.add_argument("--skip-token-store", action="store_true")
+    parser.add_argument(
+        "--dedupe-threshold",
+        type=float,
+        default=0.8,
+        help="MinHash Jaccard threshold for near-duplicate chunks, 0 disables.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only embed and write chunks that are not in the collection yet.",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="With --incremental, delete stored chunks the dataset no longer produces.",
+    )
+    args = parser.parse_args(argv)
+
+    from src.database import VectorDB
+
+    embeddings = None
+    if args.fake_embeddings:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        embeddings = DeterministicFakeEmbedding(size=VectorDB.EMBEDDING_DIMENSIONS)
+
+    checkpoint = IngestCheckpoint(args.checkpoint)
+    if args.restart:
+        checkpoint.clear()
+
+    db = VectorDB(embeddings=embeddings)
+    db.enable_citation_indexing()
+    pipeline = IngestPipeline(
+        db,
+        batch_size=args.batch_size,
+        max_concurrency=args.max_concurrency,
+        requests_per_minute=args.requests_per_minute,
+        checkpoint=checkpoint,
+        build_token_store=not args.skip_token_store,
+        incremental=args.incremental,
+        prune=args.prune,
+        dedupe_threshold=args.dedupe_threshold,
+    )
+    pipeline.run(iter_corpus_rows(jsonl_path=args.jsonl))
+    db.enable_hnsw_indexing()
+    db.enable_lexical_indexing()
+
+
+if __name__ == "__main__":
+    main()
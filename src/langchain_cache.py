@@ -0,0 +1,143 @@
+# LangChain cache integrations, kept apart from src.cache: importing the
+# langchain_core base classes pulls in the LangSmith client, which src.database
+# should not pay for at import time.
+from collections import defaultdict
+from typing import List, Optional
+from langchain_core.caches import BaseCache
+from langchain_core.embeddings import Embeddings
+from langchain_core.load import dumps, loads
+import threading
+import hashlib
+import json
+import sqlite3
+import time
+
+from src.cache import LRUCache, make_key
+from src.utils import current_node
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that caches `embed_query` results, keyed by the
+    normalized query text and the model name. Document embeddings are passed
+    through untouched.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[LRUCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or LRUCache()
+        self.model_name = getattr(embeddings, "model", type(embeddings).__name__)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = make_key(self.model_name, text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self.cache.set(key, embedding)
+        return embedding
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = make_key(self.model_name, text)
+        embedding = self.cache.get(key)
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(text)
+            self.cache.set(key, embedding)
+        return embedding
+
+
+class PromptCache(BaseCache):
+    """
+    Persistent content-addressed cache for LLM calls, installed with
+    `ChatOpenAI(..., cache=PromptCache(...))`. It covers both `model.invoke`
+    and `model.with_structured_output(...).invoke`.
+
+    Entries are keyed by a hash of the LLM string (model name, temperature and
+    bound tools/schema) and the prompt, so it is only meant for deterministic
+    (temperature=0) models. Entries older than `max_age` seconds are ignored
+    and removed, and the least recently used are evicted above `max_entries`.
+    Hits and misses are counted per graph node.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(
+        self,
+        path: str = ":memory:",
+        max_entries: int = 10000,
+        max_age: Optional[float] = 7 * 24 * 3600,
+    ):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.metrics = defaultdict(lambda: {"hits": 0, "misses": 0})
+        self._updates = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prompt_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, created_at REAL, last_access REAL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def _record(self, hit: bool) -> None:
+        self.metrics[current_node.get() or "unknown"]["hits" if hit else "misses"] += 1
+
+    def lookup(self, prompt: str, llm_string: str):
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM prompt_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or (self.max_age and row[1] < now - self.max_age):
+                self._record(False)
+                return None
+            self._conn.execute(
+                "UPDATE prompt_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            self._record(True)
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        value = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prompt_cache (key, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._updates += 1
+            if self._updates % self.EVICT_EVERY == 0:
+                self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float) -> None:
+        if self.max_age:
+            self._conn.execute(
+                "DELETE FROM prompt_cache WHERE created_at < ?", (now - self.max_age,)
+            )
+        self._conn.execute(
+            "DELETE FROM prompt_cache WHERE key NOT IN ("
+            "SELECT key FROM prompt_cache ORDER BY last_access DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM prompt_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {node: dict(counts) for node, counts in self.metrics.items()}
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from langchain_core.callbacks import BaseCallbackHandler
+import threading
+import inspect
+import json
+import time
+import os
+
+from src.utils import current_node
+
+
+class Metrics:
+    """
+    In-process counters and summaries (count/sum) with labels, optionally
+    appended to a JSON-lines trace file as they are recorded.
+
+    `render` formats them in the Prometheus text exposition format, served by
+    `start_metrics_server`. Nothing leaves the machine.
+    """
+
+    PREFIX = "louis_"
+
+    def __init__(self, trace_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self._counters = defaultdict(float)
+        self._summaries = defaultdict(lambda: [0, 0.0])
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _labels(labels: dict) -> tuple:
+        node = current_node.get()
+        if node is not None and "node" not in labels:
+            labels = {**labels, "node": node}
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            self._counters[key] += value
+            self._trace(name, value, key[1])
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, self._labels(labels))
+        with self._lock:
+            summary = self._summaries[key]
+            summary[0] += 1
+            summary[1] += value
+            self._trace(name, value, key[1])
+
+    @contextmanager
+    def timed(self, name: str, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - started, **labels)
+
+    def _trace(self, name: str, value: float, labels: tuple) -> None:
+        if not self.trace_path:
+            return
+        with open(self.trace_path, "a", encoding="utf-8") as file:
+            file.write(
+                json.dumps({"ts": time.time(), "metric": name, "value": value, **dict(labels)})
+                + "\n"
+            )
+
+    def render(self) -> str:
+        def series(name, labels, suffix=""):
+            text = ",".join(f'{key}="{value}"' for key, value in labels)
+            return f"{self.PREFIX}{name}{suffix}{{{text}}}" if text else f"{self.PREFIX}{name}{suffix}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{series(name, labels, '_total')} {value}")
+            for (name, labels), (count, total) in sorted(self._summaries.items()):
+                lines.append(f"{series(name, labels, '_count')} {count}")
+                lines.append(f"{series(name, labels, '_sum')} {total}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(trace_path=os.getenv("LOUIS_METRICS_TRACE"))
+
+
+def instrumented(name: str, count_results: bool = False):
+    """
+    Time every call of the decorated function (sync or async) as `<name>_seconds`,
+    and with `count_results` record the length of the returned list.
+    """
+
+    def decorate(func):
+        def record(result):
+            if count_results and result is not None:
+                metrics.observe(f"{name}_results", len(result))
+            return result
+
+        if inspect.iscoroutinefunction(func):
+
+            @wraps(func)
+            async def awrapper(*args, **kwargs):
+                with metrics.timed(name):
+                    return record(await func(*args, **kwargs))
+
+            return awrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with metrics.timed(name):
+                return record(func(*args, **kwargs))
+
+        return wrapper
+
+    return decorate
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Callback recording the prompt/completion tokens of every LLM call, per graph node."""
+
+    def on_llm_end(self, response, **kwargs) -> None:
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                prompt_tokens += (usage or {}).get("input_tokens", 0)
+                completion_tokens += (usage or {}).get("output_tokens", 0)
+        if not prompt_tokens and not completion_tokens:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        metrics.inc("llm_calls")
+        metrics.inc("llm_prompt_tokens", prompt_tokens)
+        metrics.inc("llm_completion_tokens", completion_tokens)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: Optional[int] = None):
+    """Serve `metrics.render()` on `port` (or LOUIS_METRICS_PORT) in a daemon thread."""
+    port = port or int(os.getenv("LOUIS_METRICS_PORT", 0))
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+    return server
@@ -1,22 +1,43 @@
 from typing import List, TypedDict, Set
+import inspect
+import asyncio
 from langgraph.graph import StateGraph, START, END
-from langchain.schema import HumanMessage
+from langchain.schema import AIMessage, HumanMessage
 
 from src.nodes.grader import (
+    agrade_compliance_node,
+    agrade_hallucination_node,
+    agrade_quality_node,
+    aintent_identification_node,
+    averify_hallucination_node,
     grade_compliance_node,
     grade_hallucination_node,
     grade_quality_node,
     intent_identification_node,
     verify_hallucination_node,
 )
-from src.nodes.summarise import summarise_document_node
-from src.nodes.scoring import complexity_scoring_node
-from src.nodes.retrieval import create_retrieval_prompt_node
+from src.nodes.summarise import asummarise_document_node, summarise_document_node
+from src.nodes.scoring import acomplexity_scoring_node, complexity_scoring_node
+from src.nodes.retrieval import (
+    acreate_retrieval_prompt_node,
+    create_retrieval_prompt_node,
+)
 from src.nodes.search import (
+    arecursive_vectorstore_node,
+    aresponse_constructor_node,
     recursive_vectorstore_node,
     response_constructor_node,
 )
+from src.budget import (
+    BUDGET_EXHAUSTED,
+    bounded_route,
+    budget_config,
+    budget_exhausted_node,
+)
+from src.citations import extract_query_citation_keys
 from src.constant import Routing
+from src.metrics import metrics
+from src.utils import node_scope
 
 
 class GraphState(TypedDict):
@@ -32,17 +53,61 @@ class GraphState(TypedDict):
     intent_type: str
     vectorstore_summary: str
     retrieved_docs: List[str]
+    response_doc_ids: List[str]
+    retrieval_ranks: dict
     user_context: str
     system_context: str
     response: List[object]
     depth: int
     excluded_file_ids: Set[str]
+    retrieval_concurrency: int
+    summarise_concurrency: int
+    context_budgets: dict
+    session_index: object
+    citation_query: str
+    ef_search: int
+    recursive_ef_search: int
     hallucination: bool
     hallucination_reason: str
     quality: bool
     quality_reason: str
     compliance: bool
     compliance_reason: str
+    budget: object
+    budget_exhausted: bool
+
+
+NODES = {
+    "intent_identification": intent_identification_node,
+    "summarise_document": summarise_document_node,
+    "complexity_ranking": complexity_scoring_node,
+    "retrieval_prompt": create_retrieval_prompt_node,
+    "response_constructor": response_constructor_node,
+    "vectorstore_recursive": recursive_vectorstore_node,
+    "grader_hallucination": grade_hallucination_node,
+    "verify_hallucination": verify_hallucination_node,
+    "grader_quality": grade_quality_node,
+    "grader_compliance": grade_compliance_node,
+}
+
+ASYNC_NODES = {
+    "intent_identification": aintent_identification_node,
+    "summarise_document": asummarise_document_node,
+    "complexity_ranking": acomplexity_scoring_node,
+    "retrieval_prompt": acreate_retrieval_prompt_node,
+    "response_constructor": aresponse_constructor_node,
+    "vectorstore_recursive": arecursive_vectorstore_node,
+    "grader_hallucination": agrade_hallucination_node,
+    "verify_hallucination": averify_hallucination_node,
+    "grader_quality": agrade_quality_node,
+    "grader_compliance": agrade_compliance_node,
+}
+
+GRADER_OUTPUT_KEYS = {
+    "grader_hallucination": ("hallucination", "hallucination_reason"),
+    "grader_quality": ("quality", "quality_reason"),
+    "grader_compliance": ("compliance", "compliance_reason"),
+}
 
 
 def handle_unrelated_content(state):
@@ -51,7 +116,75 @@ def handle_unrelated_content(state):
     )
     return state
 
-def build_graph():
+
+def track_node(name, node):
+    """
+    Run `node` with its graph node name set, so cache, token and retrieval
+    metrics recorded inside it are labelled with the node, and time it.
+    """
+    if inspect.iscoroutinefunction(node):
+
+        async def atracked(state):
+            metrics.inc("node_runs", node=name)
+            with node_scope(name), metrics.timed("node"):
+                return await node(state)
+
+        return atracked
+
+    def tracked(state):
+        metrics.inc("node_runs", node=name)
+        with node_scope(name), metrics.timed("node"):
+            return node(state)
+
+    return tracked
+
+
+def grader_branch(node, keys):
+    """
+    Wrap a grader so it only writes its own verdict keys. Parallel branches
+    writing the whole state would conflict on every other key.
+    """
+
+    if inspect.iscoroutinefunction(node):
+
+        async def abranch(state):
+            graded = await node(dict(state))
+            return {key: graded[key] for key in keys}
+
+        return abranch
+
+    def branch(state):
+        graded = node(dict(state))
+        return {key: graded[key] for key in keys}
+
+    return branch
+
+
+def join_grader_verdicts(state):
+    return {}
+
+
+def route_grader_verdicts(state):
+    """Same precedence as the sequential graders: hallucination, quality, compliance."""
+    if state["hallucination"]:
+        return "verify_hallucination"
+    if not state["quality"]:
+        return "intent_identification"
+    if not state["compliance"]:
+        return "complexity_ranking"
+    return END
+
+
+def add_bounded_edges(workflow, source, route, path_map, cycles=None, verdicts=()):
+    """Conditional edges that can also leave for `budget_exhausted`, see bounded_route."""
+    workflow.add_conditional_edges(
+        source,
+        bounded_route(route, path_map, cycles, verdicts),
+        {**path_map, BUDGET_EXHAUSTED: BUDGET_EXHAUSTED},
+    )
+
+
+def build_graph(parallel_graders=False, async_mode=False):
     """
     Build the workflow as a graph.
     1. what is the intent of this query
@@ -67,30 +200,56 @@ def build_graph():
     11. is there biasness (go back to 2 if yes)
     12. is my answer relevant to my question (go back to 4 if no)
     13. does the intent includes wanting to generate a document
+
+    With `parallel_graders`, steps 10-12 run concurrently after the response
+    is constructed and their verdicts are joined before routing.
+
+    Every retry cycle and the deadline/token limits are bounded by the
+    `budget` (a RequestBudget) passed in the inputs, if any. When it runs out
+    the graph ends with the best response so far and `budget_exhausted` set.
+
+    With `async_mode`, every node is registered with its `ainvoke` based
+    variant, so the compiled app is meant to be run with `ainvoke`/`astream`.
     """
 
     workflow = StateGraph(GraphState)
 
-    workflow.add_node("intent_identification", intent_identification_node)
-    workflow.add_node("summarise_document", summarise_document_node)
-    workflow.add_node("complexity_ranking", complexity_scoring_node)
-    workflow.add_node("retrieval_prompt", create_retrieval_prompt_node)
-    workflow.add_node("response_constructor", response_constructor_node)
-    workflow.add_node("vectorstore_recursive", recursive_vectorstore_node)
+    nodes = ASYNC_NODES if async_mode else NODES
+
+    nodes = {name: track_node(name, node) for name, node in nodes.items()}
+
+    workflow.add_node("intent_identification", nodes["intent_identification"])
+    workflow.add_node("summarise_document", nodes["summarise_document"])
+    workflow.add_node("complexity_ranking", nodes["complexity_ranking"])
+    workflow.add_node("retrieval_prompt", nodes["retrieval_prompt"])
+    workflow.add_node("response_constructor", nodes["response_constructor"])
+    workflow.add_node("vectorstore_recursive", nodes["vectorstore_recursive"])
     # workflow.add_node("web_search", web_search_node)
 
-    workflow.add_node("grader_hallucination", grade_hallucination_node)
-    workflow.add_node("verify_hallucination", verify_hallucination_node)
-    workflow.add_node("grader_quality", grade_quality_node)
-    workflow.add_node("grader_compliance", grade_compliance_node)
+    graders = {
+        name: nodes[name]
+        for name in ("grader_hallucination", "grader_quality", "grader_compliance")
+    }
+    if parallel_graders:
+        for name, node in graders.items():
+            workflow.add_node(name, grader_branch(node, GRADER_OUTPUT_KEYS[name]))
+        workflow.add_node("grader_join", track_node("grader_join", join_grader_verdicts))
+    else:
+        for name, node in graders.items():
+            workflow.add_node(name, node)
+    workflow.add_node("verify_hallucination", nodes["verify_hallucination"])
 
-    workflow.add_node("out_of_scope", handle_unrelated_content)
+    workflow.add_node("out_of_scope", track_node("out_of_scope", handle_unrelated_content))
+    workflow.add_node(
+        BUDGET_EXHAUSTED, track_node(BUDGET_EXHAUSTED, budget_exhausted_node)
+    )
 
     # 1. what is the intent of this query
     workflow.add_edge(START, "intent_identification")
     # 2. does the intent includes wanting to analyse a document
     # 3. summarise the document if document is longer than x and add to user_context in query
-    workflow.add_conditional_edges(
+    add_bounded_edges(
+        workflow,
         "intent_identification",
         lambda state: state["intent_type"],
         {"summarise": "summarise_document", "qa": "complexity_ranking"},
@@ -98,7 +257,8 @@ def build_graph():
     workflow.add_edge("summarise_document", "complexity_ranking")
     # 4. am I fit to answer this question
     # 5. do I need more system_context in answering this question
-    workflow.add_conditional_edges(
+    add_bounded_edges(
+        workflow,
         "complexity_ranking",
         lambda state: state["complexity"],
         {
@@ -112,43 +272,203 @@ def build_graph():
     # 9. let's put the information together and generate an answer
     workflow.add_edge("vectorstore_recursive", "response_constructor")
     # 10. is there hallucination to my answer? (go back to 6 if no)
-    workflow.add_edge("response_constructor", "grader_hallucination")
-    workflow.add_conditional_edges(
-        "grader_hallucination",
-        lambda state: state["hallucination"],
-        {
-            False: "grader_quality",
-            True: "verify_hallucination",
-        },
-    )
-    workflow.add_conditional_edges(
+    # 11. is there biasness (go back to 2 if yes)
+    # 12. is my answer relevant to my question (go back to 4 if no)
+    if parallel_graders:
+        for name in graders:
+            workflow.add_edge("response_constructor", name)
+        workflow.add_edge(list(graders), "grader_join")
+        add_bounded_edges(
+            workflow,
+            "grader_join",
+            route_grader_verdicts,
+            {
+                "verify_hallucination": "verify_hallucination",
+                "intent_identification": "intent_identification",
+                "complexity_ranking": "complexity_ranking",
+                END: END,
+            },
+            cycles={
+                "intent_identification": "quality",
+                "complexity_ranking": "compliance",
+            },
+            verdicts=("hallucination", "quality", "compliance"),
+        )
+    else:
+        workflow.add_edge("response_constructor", "grader_hallucination")
+        add_bounded_edges(
+            workflow,
+            "grader_hallucination",
+            lambda state: state["hallucination"],
+            {
+                False: "grader_quality",
+                True: "verify_hallucination",
+            },
+            verdicts=("hallucination",),
+        )
+        add_bounded_edges(
+            workflow,
+            "grader_quality",
+            lambda state: state["quality"],
+            {
+                True: "grader_compliance",
+                False: "intent_identification",
+            },
+            cycles={False: "quality"},
+            verdicts=("hallucination", "quality"),
+        )
+        add_bounded_edges(
+            workflow,
+            "grader_compliance",
+            lambda state: state["compliance"],
+            {
+                True: END,
+                False: "complexity_ranking",
+            },
+            cycles={False: "compliance"},
+            verdicts=("hallucination", "quality", "compliance"),
+        )
+    add_bounded_edges(
+        workflow,
         "verify_hallucination",
         lambda state: state["hallucination"],
         {
             False: "retrieval_prompt",
             True: "verify_hallucination",
         },
-    )
-    # 11. is there biasness (go back to 2 if yes)
-    workflow.add_conditional_edges(
-        "grader_quality",
-        lambda state: state["quality"],
-        {
-            True: "grader_compliance",
-            False: "intent_identification",
-        },
-    )
-    # 12. is my answer relevant to my question (go back to 4 if no)
-    workflow.add_conditional_edges(
-        "grader_compliance",
-        lambda state: state["compliance"],
-        {
-            True: END,
-            False: "complexity_ranking",
-        },
+        cycles={False: "hallucination", True: "verify_hallucination"},
+        verdicts=("hallucination",),
     )
 
     # workflow.add_edge("web_search", END)
     workflow.add_edge("out_of_scope", END)
+    workflow.add_edge(BUDGET_EXHAUSTED, END)
 
     return workflow
+
+
+class CachedApp:
+    """
+    Semantic answer cache in front of a compiled graph.
+
+    The cache key is the query embedding (matched by similarity), an exact
+    hash of the citations in the query, the `user_context` and the session's
+    uploads, and the corpus version of the vector store, so answers are
+    invalidated whenever ingest changes the collection. Questions that only
+    differ in the cited case are near identical embeddings, the citation hash
+    keeps them apart. A hit returns the stored answer without running the
+    graph. Answers cut short by the request budget are not stored.
+    """
+
+    def __init__(self, app, cache):
+        self.app = app
+        self.cache = cache
+
+    def _key(self, inputs):
+        db = inputs["db"]
+        return (
+            db.embeddings.embed_query(inputs["query"]),
+            self.cache.context_hash(
+                "\x00".join(
+                    [
+                        *extract_query_citation_keys(inputs["query"]),
+                        inputs.get("user_context") or "",
+                        # Uploaded files searched this session change the answer too
+                        *sorted(getattr(inputs.get("session_index"), "digests", ())),
+                    ]
+                )
+            ),
+            db.corpus_version(),
+        )
+
+    def _cached_output(self, inputs, key):
+        answer = self.cache.lookup(*key)
+        if answer is None:
+            return None
+        return {**inputs, "response": AIMessage(content=answer), "cache_hit": True}
+
+    def _store(self, inputs, key, output):
+        response = output.get("response")
+        if getattr(response, "content", None) and not output.get("budget_exhausted"):
+            self.cache.store(inputs["query"], key[0], key[1], key[2], response.content)
+
+    def invoke(self, inputs, config=None):
+        key = self._key(inputs)
+        cached = self._cached_output(inputs, key)
+        if cached is not None:
+            return cached
+
+        output = self.app.invoke(
+            inputs, config=budget_config(inputs.get("budget"), config)
+        )
+        self._store(inputs, key, output)
+        return output
+
+    def stream(self, inputs, config=None, stream_mode="values"):
+        """
+        Stream the compiled graph with the same cache in front. A hit yields
+        the cached output once, as a "values" chunk.
+        """
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        key = self._key(inputs)
+        cached = self._cached_output(inputs, key)
+        if cached is not None:
+            if "values" in modes:
+                yield emit("values", cached)
+            return
+
+        # The final state is needed for the cache even if the caller skips it
+        output = {}
+        for mode, chunk in self.app.stream(
+            inputs,
+            config=budget_config(inputs.get("budget"), config),
+            stream_mode=list(dict.fromkeys([*modes, "values"])),
+        ):
+            if mode == "values":
+                output = chunk
+            if mode in modes:
+                yield emit(mode, chunk)
+        self._store(inputs, key, output)
+
+    async def ainvoke(self, inputs, config=None):
+        """`invoke` for a graph built with `async_mode`."""
+        key = await asyncio.to_thread(self._key, inputs)
+        cached = await asyncio.to_thread(self._cached_output, inputs, key)
+        if cached is not None:
+            return cached
+
+        output = await self.app.ainvoke(
+            inputs, config=budget_config(inputs.get("budget"), config)
+        )
+        await asyncio.to_thread(self._store, inputs, key, output)
+        return output
+
+    async def astream(self, inputs, config=None, stream_mode="values"):
+        """`stream` for a graph built with `async_mode`."""
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode, chunk):
+            return chunk if isinstance(stream_mode, str) else (mode, chunk)
+
+        key = await asyncio.to_thread(self._key, inputs)
+        cached = await asyncio.to_thread(self._cached_output, inputs, key)
+        if cached is not None:
+            if "values" in modes:
+                yield emit("values", cached)
+            return
+
+        output = {}
+        async for mode, chunk in self.app.astream(
+            inputs,
+            config=budget_config(inputs.get("budget"), config),
+            stream_mode=list(dict.fromkeys([*modes, "values"])),
+        ):
+            if mode == "values":
+                output = chunk
+            if mode in modes:
+                yield emit(mode, chunk)
+        await asyncio.to_thread(self._store, inputs, key, output)
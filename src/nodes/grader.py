@@ -1,3 +1,4 @@
+from src.context import assemble_context
 from src.templates import (
     HallucinationGrader,
     QualityGrader,
@@ -8,8 +9,7 @@ from langchain.schema import HumanMessage
 from langchain_community.tools import DuckDuckGoSearchRun
 
 
-def intent_identification_node(state):
-    model = state["model"]
+def _intent_identification_prompt(state):
     query = state["query"]
 
     prompt = f"""
@@ -35,6 +35,12 @@ def intent_identification_node(state):
 
     Respond with JSON only:
     """
+    return prompt
+
+
+def intent_identification_node(state):
+    model = state["model"]
+    prompt = _intent_identification_prompt(state)
 
     # Assuming you have a pydantic schema called intent_identification_template
     structured_output_parser = model.with_structured_output(IntentIdentification)
@@ -47,16 +53,25 @@ def intent_identification_node(state):
     return state
 
 
-def grade_hallucination_node(state):
-    """
-    Checks if the response contains hallucinated or fabricated info.
-    We'll ask the model: "Does this text contain hallucinations? (YES/NO)"
-    Then set 'hallucination' to True (YES) or False (NO).
-    """
+async def aintent_identification_node(state):
     model = state["model"]
+    prompt = _intent_identification_prompt(state)
+
+    structured_output_parser = model.with_structured_output(IntentIdentification)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=prompt)]
+    )
+    state["intent"] = decision_response.intent
+
+    return state
+
+
+def _grade_hallucination_prompt(state):
     response = state["response"].content
-    user_context = state.get("user_context", None)
-    system_context = state.get("system_context", None)
+    # The passages the answer cites come first within the budget
+    system_context, user_context, _ = assemble_context(
+        state, "grader_hallucination", answer=response
+    )
 
     check_prompt = f"""
 You are an **expert AI fact checker with legal domain expertise**, specializing in detecting hallucinated, fabricated, or inaccurate information in legal advice and documents.
@@ -106,6 +121,17 @@ Determine whether the provided **Statement** contains any fabricated, unverified
   "reason": "Brief explanation (one sentence)."
 }}
 """
+    return check_prompt
+
+
+def grade_hallucination_node(state):
+    """
+    Checks if the response contains hallucinated or fabricated info.
+    We'll ask the model: "Does this text contain hallucinations? (YES/NO)"
+    Then set 'hallucination' to True (YES) or False (NO).
+    """
+    model = state["model"]
+    check_prompt = _grade_hallucination_prompt(state)
     structured_output_parser = model.with_structured_output(HallucinationGrader)
     decision_response = structured_output_parser.invoke(
         [HumanMessage(content=check_prompt)]
@@ -115,18 +141,25 @@ Determine whether the provided **Statement** contains any fabricated, unverified
     return state
 
 
-def verify_hallucination_node(state):
-    """
-    Verifies if the AI response contains hallucinations by checking citations
-    against the retrieved document metadata and (optionally) web search results.
-    """
+async def agrade_hallucination_node(state):
     model = state["model"]
+    check_prompt = _grade_hallucination_prompt(state)
+    structured_output_parser = model.with_structured_output(HallucinationGrader)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=check_prompt)]
+    )
+    state["hallucination"] = decision_response.hallucination
+    state["hallucination_reason"] = decision_response.reason
+    return state
+
+
+def _verify_hallucination_prompt(state):
     query = state["query"]
     intent = state["intent"]
     response = state["response"].content
-    user_context = state.get("user_context", None)
-    system_context = state.get("system_context", None)
-    retrieved_docs = state["retrieved_docs"]  # List of Document objects
+    system_context, user_context, retrieved_docs = assemble_context(
+        state, "verify_hallucination", answer=response
+    )  # retrieved_docs: the Document objects behind system_context
 
     # Extract metadata from retrieved docs
     metadata_list = [doc.metadata for doc in retrieved_docs]
@@ -203,6 +236,16 @@ Respond **only** with the following JSON structure:
 }}
 
 """
+    return prompt
+
+
+def verify_hallucination_node(state):
+    """
+    Verifies if the AI response contains hallucinations by checking citations
+    against the retrieved document metadata and (optionally) web search results.
+    """
+    model = state["model"]
+    prompt = _verify_hallucination_prompt(state)
     structured_output_parser = model.with_structured_output(HallucinationGrader)
     decision_response = structured_output_parser.invoke([HumanMessage(content=prompt)])
     state["hallucination"] = decision_response.hallucination
@@ -210,14 +253,19 @@ Respond **only** with the following JSON structure:
     return state
 
 
-def grade_quality_node(state):
-    """
-    Determines if the response meets a certain 'quality' threshold.
-    Uses a model to assess relevance, coherence, and completeness.
-    Sets 'quality' to True if all criteria are met; otherwise, False.
-    Also provides reasoning.
-    """
+async def averify_hallucination_node(state):
     model = state["model"]
+    prompt = _verify_hallucination_prompt(state)
+    structured_output_parser = model.with_structured_output(HallucinationGrader)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=prompt)]
+    )
+    state["hallucination"] = decision_response.hallucination
+    state["hallucination_reason"] = decision_response.reason
+    return state
+
+
+def _grade_quality_prompt(state):
     query = state["query"]
     intent = state["intent"]
     response = state["response"]
@@ -261,12 +309,10 @@ def grade_quality_node(state):
     "reason": "Brief explanation of the grading decision."
     }}
     """
+    return check_prompt
 
-    structured_output_parser = model.with_structured_output(QualityGrader)
-    decision_response = structured_output_parser.invoke(
-        [HumanMessage(content=check_prompt)]
-    )
 
+def _apply_quality_grade(state, decision_response):
     # Assume decision_response is an object or dict with the following fields
     relevance = decision_response.relevance
     coherence = decision_response.coherence
@@ -279,14 +325,35 @@ def grade_quality_node(state):
     return state
 
 
-def grade_compliance_node(state):
+def grade_quality_node(state):
     """
-    Checks if the response meets ethical compliance criteria:
-    - Objectivity
-    - No discriminatory, racist, sexist, or offensive content
-    Sets 'compliance' to True (YES) or False (NO).
+    Determines if the response meets a certain 'quality' threshold.
+    Uses a model to assess relevance, coherence, and completeness.
+    Sets 'quality' to True if all criteria are met; otherwise, False.
+    Also provides reasoning.
     """
     model = state["model"]
+    check_prompt = _grade_quality_prompt(state)
+
+    structured_output_parser = model.with_structured_output(QualityGrader)
+    decision_response = structured_output_parser.invoke(
+        [HumanMessage(content=check_prompt)]
+    )
+    return _apply_quality_grade(state, decision_response)
+
+
+async def agrade_quality_node(state):
+    model = state["model"]
+    check_prompt = _grade_quality_prompt(state)
+
+    structured_output_parser = model.with_structured_output(QualityGrader)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=check_prompt)]
+    )
+    return _apply_quality_grade(state, decision_response)
+
+
+def _grade_compliance_prompt(state):
     response = state[
         "response"
     ].content  # assuming response is a HumanMessage or LLM output
@@ -336,6 +403,18 @@ AI-Generated Response:
     "valid": "True" | "False", "reason": "Brief explanation of legal compliance or non-compliance."
 
     """
+    return check_prompt
+
+
+def grade_compliance_node(state):
+    """
+    Checks if the response meets ethical compliance criteria:
+    - Objectivity
+    - No discriminatory, racist, sexist, or offensive content
+    Sets 'compliance' to True (YES) or False (NO).
+    """
+    model = state["model"]
+    check_prompt = _grade_compliance_prompt(state)
 
     structured_output_parser = model.with_structured_output(ComplianceGrader)
     decision_response = structured_output_parser.invoke(
@@ -344,3 +423,16 @@ AI-Generated Response:
     state["compliance"] = decision_response.compliance
     state["compliance_reason"] = decision_response.reason
     return state
+
+
+async def agrade_compliance_node(state):
+    model = state["model"]
+    check_prompt = _grade_compliance_prompt(state)
+
+    structured_output_parser = model.with_structured_output(ComplianceGrader)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=check_prompt)]
+    )
+    state["compliance"] = decision_response.compliance
+    state["compliance_reason"] = decision_response.reason
+    return state
@@ -1,16 +1,12 @@
 from langchain.schema import HumanMessage
+from src.context import assemble_context
 from src.templates import ResponseSufficency
 
 
-def create_retrieval_prompt_node(state):
-    """
-    Node: Create an optimized retrieval prompt for similarity search in the vector store.
-    """
-
+def _retrieval_prompt(state):
     query = state["query"]
-    model = state["model"]
     intent = state["intent"]
-    user_context = state.get("user_context", None)
+    _, user_context, _ = assemble_context(state, "retrieval_prompt")
     hallucination = state.get("hallucination", False)
     hallucination_reason = state.get("hallucination_reason", "")
     quality = state.get("quality", False)
@@ -86,20 +82,33 @@ Based on the above instructions, rewrite the user's query as an **optimized retr
 
 ### ✅ **Optimized Retrieval Prompt:**  
 """
+    return prompt
+
+
+def create_retrieval_prompt_node(state):
+    """
+    Node: Create an optimized retrieval prompt for similarity search in the vector store.
+    """
+    model = state["model"]
+    prompt = _retrieval_prompt(state)
 
     response = model.invoke([HumanMessage(content=prompt)])
     state["response"] = response
     return state
 
 
-def check_completeness_with_llm(state):
-    model, query = state["model"], state["query"]
-    user_context = state.get("user_context", None)
-    system_context = state.get("system_context", None)
-    """
-    Uses the LLM to determine whether the retrieved legal context is sufficient 
-    or if additional retrieval is necessary.
-    """
+async def acreate_retrieval_prompt_node(state):
+    model = state["model"]
+    prompt = _retrieval_prompt(state)
+
+    response = await model.ainvoke([HumanMessage(content=prompt)])
+    state["response"] = response
+    return state
+
+
+def _completeness_prompt(state):
+    query = state["query"]
+    system_context, user_context, _ = assemble_context(state, "completeness")
     completeness_prompt = f"""
 You are a **highly skilled legal AI auditor**. Your role is to **critically assess the completeness and sufficiency** of the retrieved legal context for answering a user’s query.
 
@@ -150,9 +159,30 @@ Your evaluation must be **thorough, precise, and strict**. Assume that any missi
   ]
 }}
 """
+    return completeness_prompt
+
+
+def check_completeness_with_llm(state):
+    """
+    Uses the LLM to determine whether the retrieved legal context is sufficient 
+    or if additional retrieval is necessary.
+    """
+    model = state["model"]
+    completeness_prompt = _completeness_prompt(state)
     structured_output_parser = model.with_structured_output(ResponseSufficency)
     response = structured_output_parser.invoke(
         [HumanMessage(content=completeness_prompt)]
     )
 
     return response
+
+
+async def acheck_completeness_with_llm(state):
+    model = state["model"]
+    completeness_prompt = _completeness_prompt(state)
+    structured_output_parser = model.with_structured_output(ResponseSufficency)
+    response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=completeness_prompt)]
+    )
+
+    return response
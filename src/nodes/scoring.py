@@ -1,22 +1,13 @@
 from langchain.schema import HumanMessage
 
 from src.constant import Routing
-from src.templates import ComplexityRank
-
-from langchain.schema import HumanMessage
-from src.constant import Routing
+from src.context import assemble_context
 from src.templates import ComplexityRank
 
 
-def complexity_scoring_node(state):
-    """
-    Uses an LLM to rank the complexity of the query based on what is already known
-    in the vector store and any user-uploaded context.
-    Returns 'LOW', 'MEDIUM', 'HIGH' complexity, or 'UNRELATED' if it's out of scope.
-    """
+def _complexity_prompt(state):
     query = state["query"]
-    model = state["model"]
-    user_context = state.get("user_context", None)
+    _, user_context, _ = assemble_context(state, "complexity_ranking")
     vectorstore_summary = state["vectorstore_summary"]
 
     decision_prompt = f"""
@@ -95,6 +86,17 @@ Choose **one** complexity ranking from the following list (no explanations):
 
 Respond with the **selected complexity level only**.
 """
+    return decision_prompt
+
+
+def complexity_scoring_node(state):
+    """
+    Uses an LLM to rank the complexity of the query based on what is already known
+    in the vector store and any user-uploaded context.
+    Returns 'LOW', 'MEDIUM', 'HIGH' complexity, or 'UNRELATED' if it's out of scope.
+    """
+    model = state["model"]
+    decision_prompt = _complexity_prompt(state)
 
     structured_output_parser = model.with_structured_output(ComplexityRank)
     decision_response = structured_output_parser.invoke(
@@ -102,3 +104,15 @@ Respond with the **selected complexity level only**.
     )
     state["complexity"] = decision_response.complexity
     return state
+
+
+async def acomplexity_scoring_node(state):
+    model = state["model"]
+    decision_prompt = _complexity_prompt(state)
+
+    structured_output_parser = model.with_structured_output(ComplexityRank)
+    decision_response = await structured_output_parser.ainvoke(
+        [HumanMessage(content=decision_prompt)]
+    )
+    state["complexity"] = decision_response.complexity
+    return state
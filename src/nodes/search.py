@@ -1,11 +1,27 @@
+from concurrent.futures import ThreadPoolExecutor
 from langchain.schema import HumanMessage
+import contextvars
+import asyncio
 
+from src.context import assemble_context, document_key
 from src.nodes.retrieval import (
+    acheck_completeness_with_llm,
+    acreate_retrieval_prompt_node,
     check_completeness_with_llm,
     create_retrieval_prompt_node,
 )
 
 
+def _citation_query(state):
+    """
+    Text whose citations are looked up and whose terms drive the lexical
+    search: the user query on the first pass, the missing reference alone on
+    completeness passes (their query wraps the original one, whose citations
+    were already served).
+    """
+    return state.get("citation_query") or state["query"]
+
+
 def vectorstore_node(state):
     """
     Node: Retrieves relevant legal documents from the vectorstore and generates a response.
@@ -16,26 +32,51 @@ def vectorstore_node(state):
         "excluded_file_ids", None
     )  # Default to None (include all files)
 
-    # Step 1: Retrieve relevant documents
-    retrieved_docs = vectorstore.similarity_search(
-        query, top_k=len(excluded_file_ids) + 3, initial_k=len(excluded_file_ids) + 10
-    )  # Retrieve more documents before filtering
+    # Step 1: Cited cases are fetched directly from the citation index
+    retrieved_docs = vectorstore.citation_search(
+        _citation_query(state), top_k=3, excluded_ids=excluded_file_ids
+    )
+
+    # Step 2: Otherwise retrieve relevant documents, excluded ids are filtered in the query
+    if retrieved_docs is None:
+        retrieved_docs = vectorstore.similarity_search(
+            query,
+            top_k=3,
+            initial_k=10,
+            excluded_ids=excluded_file_ids,
+            ef_search=state.get("ef_search"),
+            session_index=state.get("session_index"),
+            lexical_query=_citation_query(state),
+        )
+    return _apply_retrieved_docs(state, retrieved_docs)
 
-    # extract only the content
-    retrieved_docs = [doc[0] for doc in retrieved_docs]
 
-    # Step 2: Filter out excluded documents
-    if excluded_file_ids:
-        retrieved_docs = [
-            doc
-            for doc in retrieved_docs
-            if doc.metadata.get("id") not in excluded_file_ids
-        ]
+async def avectorstore_node(state):
+    query = state["query"]
+    vectorstore = state["db"]
+    excluded_file_ids = state.get("excluded_file_ids", None)
+
+    retrieved_docs = await asyncio.to_thread(
+        vectorstore.citation_search, _citation_query(state), 3, excluded_file_ids
+    )
+    if retrieved_docs is None:
+        retrieved_docs = await vectorstore.asimilarity_search(
+            query,
+            top_k=3,
+            initial_k=10,
+            excluded_ids=excluded_file_ids,
+            ef_search=state.get("ef_search"),
+            session_index=state.get("session_index"),
+            lexical_query=_citation_query(state),
+        )
+    return _apply_retrieved_docs(state, retrieved_docs)
 
-    # Step 3: Limit the result to top-k after filtering
-    retrieved_docs = retrieved_docs[:3]  # Ensure we still return only 3 docs
 
-    # Step 4: Check if retrieval was successful
+def _apply_retrieved_docs(state, retrieved_docs):
+    # extract only the content
+    retrieved_docs = [doc[0] for doc in retrieved_docs]
+
+    # Step 3: Check if retrieval was successful
     if not retrieved_docs:
         state["response"] = HumanMessage(
             content="No relevant legal documents were found in the database."
@@ -43,17 +84,23 @@ def vectorstore_node(state):
         return state
 
     state["retrieved_docs"] = retrieved_docs
+    # Rank within this retrieval pass, later passes are added by _merge_documents
+    state["retrieval_ranks"] = {
+        document_key(doc): (rank, 0) for rank, doc in enumerate(retrieved_docs)
+    }
     state["system_context"] = "\n\n".join(
         [f"- {doc.page_content}" for doc in state["retrieved_docs"]]
     )
     return state
 
 
-def response_constructor_node(state):
-    model = state["model"]
+def _response_prompt(state):
     query = state["query"]
-    user_context = state.get("user_context", None)
-    system_context = state.get("system_context", None)
+    system_context, user_context, documents = assemble_context(
+        state, "response_constructor"
+    )
+    # The hallucination graders check the response against exactly these
+    state["response_doc_ids"] = [document_key(doc) for doc in documents]
     intent = state["intent"]
 
     rag_prompt = f"""
@@ -124,6 +171,12 @@ Provide a professional legal opinion in the following structure:
 
 ### ✅ **Begin your response below**:
     """
+    return rag_prompt
+
+
+def response_constructor_node(state):
+    model = state["model"]
+    rag_prompt = _response_prompt(state)
 
     # Step 5: Invoke the model
     response = model.invoke([HumanMessage(content=rag_prompt)])
@@ -133,6 +186,57 @@ Provide a professional legal opinion in the following structure:
     return state
 
 
+async def aresponse_constructor_node(state):
+    model = state["model"]
+    rag_prompt = _response_prompt(state)
+
+    response = await model.ainvoke([HumanMessage(content=rag_prompt)])
+    state["response"] = response
+    return state
+
+
+DEFAULT_RETRIEVAL_CONCURRENCY = 4
+
+
+def _merge_documents(state, documents, retrieval_pass):
+    """
+    Merge newly retrieved documents into the state, skipping chunks that are
+    already present (by chunk id), and rebuild the system context.
+    """
+    seen = {document_key(doc) for doc in state["retrieved_docs"]}
+    retrieval_ranks = state.setdefault("retrieval_ranks", {})
+    for rank, doc in enumerate(documents):
+        key = document_key(doc)
+        if key not in seen:
+            seen.add(key)
+            state["retrieved_docs"].append(doc)
+            retrieval_ranks[key] = (rank, retrieval_pass)
+    state["system_context"] = "\n\n".join(
+        [f"- {doc.page_content}" for doc in state["retrieved_docs"]]
+    )
+    return state
+
+
+def _missing_reference_state(state, missing_query):
+    additional_state = state.copy()
+    additional_state[
+        "query"
+    ] = f"""
+        The retrieved documents are missing critical legal information regarding: **{missing_query}**.
+        
+        ### **Previous Query**
+        {state["query"]}
+
+        Please refine the search and retrieve documents that provide relevant information on **{missing_query}**.
+        """
+    additional_state["citation_query"] = missing_query
+    # Completeness passes can afford a wider HNSW search than the first pass
+    additional_state["ef_search"] = state.get("recursive_ef_search") or state.get(
+        "ef_search"
+    )
+    return additional_state
+
+
 def recursive_vectorstore_node(state):
     """
     Recursive retrieval node: Performs search, checks completeness, and repeats if needed.
@@ -140,7 +244,7 @@ def recursive_vectorstore_node(state):
     state = vectorstore_node(state)  # Perform initial retrieval
     state["depth"] += 1  # Increment depth counter
     for doc in state["retrieved_docs"]:
-        state["excluded_file_ids"].add(doc.id)
+        state["excluded_file_ids"].add(doc.metadata.get("id"))
 
     # Step 1: Check completeness
     completeness_result = check_completeness_with_llm(state)
@@ -155,27 +259,76 @@ def recursive_vectorstore_node(state):
     if not missing_queries:
         return state  # No further queries needed
 
-    for missing_query in missing_queries:
-        additional_state = state.copy()
-        additional_state[
-            "query"
-        ] = f"""
-        The retrieved documents are missing critical legal information regarding: **{missing_query}**.
-        
-        ### **Previous Query**
-        {state["query"]}
-
-        Please refine the search and retrieve documents that provide relevant information on **{missing_query}**.
-        """
-        additional_state = create_retrieval_prompt_node(
-            additional_state
-        )  # Generate a new retrieval prompt
-        additional_result = vectorstore_node(
-            additional_state
-        )  # Retrieve missing information
-        # Merge newly retrieved documents while avoiding duplicates
-        state["retrieved_docs"].extend(additional_result["retrieved_docs"])
-        state["system_context"] = "\n\n".join(
-            [f"- {doc.page_content}" for doc in state["retrieved_docs"]]
+    # Step 3: Retrieve every missing reference concurrently
+    concurrency = state.get("retrieval_concurrency") or DEFAULT_RETRIEVAL_CONCURRENCY
+    # Each worker runs in a copy of the caller's context so run config/callbacks follow
+    contexts = [contextvars.copy_context() for _ in missing_queries]
+    with ThreadPoolExecutor(
+        max_workers=min(concurrency, len(missing_queries))
+    ) as executor:
+        additional_docs = list(
+            executor.map(
+                lambda context, missing_query: context.run(
+                    _retrieve_missing_reference, state, missing_query
+                ),
+                contexts,
+                missing_queries,
+            )
         )
+
+    # Merge newly retrieved documents while avoiding duplicates
+    for retrieval_pass, docs in enumerate(additional_docs, start=1):
+        state = _merge_documents(state, docs, retrieval_pass)
+    return state
+
+
+def _retrieve_missing_reference(state, missing_query):
+    additional_state = _missing_reference_state(state, missing_query)
+    # Fresh list so an empty retrieval doesn't hand back the parent's documents
+    additional_state["retrieved_docs"] = []
+    additional_state = create_retrieval_prompt_node(
+        additional_state
+    )  # Generate a new retrieval prompt
+    additional_result = vectorstore_node(
+        additional_state
+    )  # Retrieve missing information
+    return additional_result["retrieved_docs"]
+
+
+async def _aretrieve_missing_reference(state, missing_query, semaphore):
+    async with semaphore:
+        additional_state = _missing_reference_state(state, missing_query)
+        additional_state["retrieved_docs"] = []
+        additional_state = await acreate_retrieval_prompt_node(additional_state)
+        additional_result = await avectorstore_node(additional_state)
+        return additional_result["retrieved_docs"]
+
+
+async def arecursive_vectorstore_node(state):
+    state = await avectorstore_node(state)
+    state["depth"] += 1
+    for doc in state["retrieved_docs"]:
+        state["excluded_file_ids"].add(doc.metadata.get("id"))
+
+    completeness_result = await acheck_completeness_with_llm(state)
+
+    if completeness_result.is_sufficient or state["depth"] >= 3:
+        return state
+
+    missing_queries = completeness_result.missing_queries
+
+    if not missing_queries:
+        return state
+
+    concurrency = state.get("retrieval_concurrency") or DEFAULT_RETRIEVAL_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+    additional_docs = await asyncio.gather(
+        *[
+            _aretrieve_missing_reference(state, missing_query, semaphore)
+            for missing_query in missing_queries
+        ]
+    )
+
+    for retrieval_pass, docs in enumerate(additional_docs, start=1):
+        state = _merge_documents(state, docs, retrieval_pass)
     return state
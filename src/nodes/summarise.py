@@ -1,11 +1,24 @@
+from concurrent.futures import ThreadPoolExecutor
 from langchain.schema import HumanMessage
+import contextvars
+import asyncio
+import os
 
+from src.utils import count_tokens
 
-def summarise_document_node(state):
-    model = state["model"]
-    user_context = state.get("user_context", None)
-    intent = state["intent"]
+# Documents up to this many tokens are summarised in a single call
+SINGLE_CALL_MAX_TOKENS = int(os.getenv("SUMMARISE_SINGLE_CALL_TOKENS", 12000))
+# Token size of the chunk groups summarised in the map step, and of the
+# partial summary groups combined in every reduce step
+GROUP_MAX_TOKENS = int(os.getenv("SUMMARISE_GROUP_TOKENS", 6000))
+DEFAULT_SUMMARISE_CONCURRENCY = int(os.getenv("SUMMARISE_CONCURRENCY", 4))
+
+
+def _summarise_prompt(state):
+    return _summary_prompt(state["intent"], state.get("user_context", None))
 
+
+def _summary_prompt(intent, user_context):
     prompt = f"""
     You are a legal AI assistant. Your task is to generate a concise and informative summary of the user's context (such as a document or conversation). The summary must focus on the parts that are **most relevant** to the user's **intent**, while ensuring that **critical information is not lost**.
 
@@ -31,6 +44,164 @@ def summarise_document_node(state):
     ### **Output**:
     Provide a clear and concise summary below.
     """
+    return prompt
+
+
+def _reduce_prompt(intent, summaries):
+    partial_summaries = "\n\n---\n\n".join(
+        f"#### Part {i + 1}\n{summary}" for i, summary in enumerate(summaries)
+    )
+    prompt = f"""
+    You are a legal AI assistant. The user's context (such as a document or conversation) was too long to read at once, so consecutive parts of it were summarised separately. Your task is to combine these partial summaries into one concise and informative summary that focuses on the parts **most relevant** to the user's **intent**, while ensuring that **critical information is not lost**.
+
+    ### Guidelines:
+    - Keep every key fact, detail and piece of important information that would help address the intent.
+    - Merge information repeated across parts, and keep the order of the original document.
+    - Be clear, professional, and accurate.
+
+    ---
+
+    ### **Intent**:
+    {intent}
+
+    ---
+
+    ### **Partial Summaries**:
+    {partial_summaries}
+
+    ---
+
+    ### **Output**:
+    Provide a clear and concise combined summary below.
+    """
+    return prompt
+
+
+def _split_oversized(text, max_tokens):
+    """Cut a single part that is larger than `max_tokens` into roughly even pieces."""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return [text]
+    size = max(1, len(text) * max_tokens // tokens)
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def _group_by_tokens(parts, max_tokens=None):
+    """Greedily pack consecutive parts into groups of at most `max_tokens` tokens."""
+    max_tokens = max_tokens or GROUP_MAX_TOKENS
+    groups, group, group_tokens = [], [], 0
+    for part in parts:
+        for piece in _split_oversized(part, max_tokens):
+            tokens = count_tokens(piece)
+            if group and group_tokens + tokens > max_tokens:
+                groups.append(group)
+                group, group_tokens = [], 0
+            group.append(piece)
+            group_tokens += tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def _needs_map_reduce(state):
+    return count_tokens(state.get("user_context") or "") > SINGLE_CALL_MAX_TOKENS
+
+
+def _map_concurrently(state, prompts):
+    model = state["model"]
+    concurrency = state.get("summarise_concurrency") or DEFAULT_SUMMARISE_CONCURRENCY
+    # Each worker runs in a copy of the caller's context so run config/callbacks follow
+    contexts = [contextvars.copy_context() for _ in prompts]
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(prompts))) as executor:
+        return list(
+            executor.map(
+                lambda context, prompt: context.run(
+                    model.invoke, [HumanMessage(content=prompt)]
+                ).content,
+                contexts,
+                prompts,
+            )
+        )
+
+
+async def _amap_concurrently(state, prompts):
+    model = state["model"]
+    concurrency = state.get("summarise_concurrency") or DEFAULT_SUMMARISE_CONCURRENCY
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def summarise(prompt):
+        async with semaphore:
+            return (await model.ainvoke([HumanMessage(content=prompt)])).content
+
+    return await asyncio.gather(*[summarise(prompt) for prompt in prompts])
+
+
+def _reduce_prompts(intent, summaries):
+    """
+    Prompts of the next reduce level, or None when the summaries fit in the
+    final reduce call (or grouping can no longer shrink them).
+    """
+    if count_tokens("\n\n".join(summaries)) <= SINGLE_CALL_MAX_TOKENS:
+        return None
+    groups = _group_by_tokens(summaries)
+    if len(groups) >= len(summaries):
+        return None
+    return [_reduce_prompt(intent, group) for group in groups]
+
+
+def map_reduce_summarise(state):
+    """
+    Summarise a long `user_context` in token-sized chunk groups (the map step,
+    run concurrently), then combine the partial summaries level by level until
+    they fit into one final reduce call.
+    """
+    intent = state["intent"]
+    chunks = state["user_context"].split("\n\n")
+    summaries = _map_concurrently(
+        state, [
+            _summary_prompt(intent, "\n\n".join(group))
+            for group in _group_by_tokens(chunks)
+        ]
+    )
+    while (prompts := _reduce_prompts(intent, summaries)) is not None:
+        summaries = _map_concurrently(state, prompts)
+    if len(summaries) == 1:
+        return summaries[0]
+    return state["model"].invoke(
+        [HumanMessage(content=_reduce_prompt(intent, summaries))]
+    ).content
+
+
+async def amap_reduce_summarise(state):
+    intent = state["intent"]
+    chunks = state["user_context"].split("\n\n")
+    summaries = await _amap_concurrently(
+        state, [
+            _summary_prompt(intent, "\n\n".join(group))
+            for group in _group_by_tokens(chunks)
+        ]
+    )
+    while (prompts := _reduce_prompts(intent, summaries)) is not None:
+        summaries = await _amap_concurrently(state, prompts)
+    if len(summaries) == 1:
+        return summaries[0]
+    reduced = await state["model"].ainvoke(
+        [HumanMessage(content=_reduce_prompt(intent, summaries))]
+    )
+    return reduced.content
+
+
+def summarise_document_node(state):
+    """
+    Summarise the user context against the intent: in a single call for
+    documents up to SINGLE_CALL_MAX_TOKENS, map-reduce above that.
+    """
+    if _needs_map_reduce(state):
+        state["user_context"] = map_reduce_summarise(state)
+        return state
+
+    model = state["model"]
+    prompt = _summarise_prompt(state)
 
     # Call the model to generate the summary
     summarised_output = model.invoke([HumanMessage(content=prompt)])
@@ -39,3 +210,17 @@ def summarise_document_node(state):
     state["user_context"] = summarised_output.content
 
     return state
+
+
+async def asummarise_document_node(state):
+    if _needs_map_reduce(state):
+        state["user_context"] = await amap_reduce_summarise(state)
+        return state
+
+    model = state["model"]
+    prompt = _summarise_prompt(state)
+
+    summarised_output = await model.ainvoke([HumanMessage(content=prompt)])
+    state["user_context"] = summarised_output.content
+
+    return state
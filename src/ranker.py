@@ -1,70 +1,346 @@
-from transformers import AutoTokenizer, AutoModel
 from typing import Optional, List, Tuple
+import numpy as np
 import torch
+import os
+
+from src.cache import LRUCache, make_key
+from src.embedding_store import TokenEmbeddingStore
+from src.metrics import instrumented, metrics
+from src.startup import shared
 
 
 class ReRanker:
+    """
+    ColBERT late-interaction reranker.
+
+    `backend` selects how the encoder runs:
+        torch       fp32 PyTorch on cuda, mps or cpu (default)
+        torch-int8  PyTorch with dynamically quantized int8 Linear layers, cpu
+        onnx        ONNX Runtime on cpu, exported to `onnx_path` on first use
+    """
+
+    BACKENDS = ("torch", "torch-int8", "onnx")
+    DEFAULT_BACKEND = os.getenv("RERANKER_BACKEND", "torch")
+
     def __init__(
         self,
         model: str = "colbert-ir/colbertv2.0",
         tokenizer: str = "colbert-ir/colbertv2.0",
         device: Optional[str] = None,
         DEFAULT_COLBERT_MAX_LENGTH=512,
+        batch_size: int = 16,
+        store: Optional[TokenEmbeddingStore] = None,
+        query_cache: Optional[LRUCache] = None,
+        backend: str = DEFAULT_BACKEND,
+        onnx_path: str = "data/colbert_onnx/model.onnx",
     ):
-        self._tokenizer = AutoTokenizer.from_pretrained(tokenizer)
-        self._model = AutoModel.from_pretrained(model)
-        self._device = device or (
+        assert backend in self.BACKENDS, f"unknown reranker backend {backend}"
+        self.backend = backend
+        self.onnx_path = onnx_path
+        self.tokenizer_name = tokenizer
+        self._requested_device = device
+        self.DEFAULT_COLBERT_MAX_LENGTH = DEFAULT_COLBERT_MAX_LENGTH
+        self.batch_size = batch_size
+        self.store = store
+        self.model_name = model
+        # Quantized/exported encoders give slightly different query embeddings
+        self.cache_name = model if backend == "torch" else f"{model}:{backend}"
+        self.query_cache = query_cache if query_cache is not None else LRUCache()
+
+    def _load(self):
+        from transformers import AutoTokenizer, AutoModel
+
+        tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+        model = AutoModel.from_pretrained(self.model_name)
+        model.eval()
+        if self.backend == "torch-int8":
+            model = torch.ao.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            return tokenizer, model, "cpu"
+        if self.backend == "onnx":
+            return tokenizer, self._onnx_session(model, tokenizer), "cpu"
+
+        device = self._requested_device or (
             "cuda"
             if torch.cuda.is_available()
             else "mps" if torch.mps.is_available() else "cpu"
         )
-        self._model.to(self._device)
-        self.DEFAULT_COLBERT_MAX_LENGTH = DEFAULT_COLBERT_MAX_LENGTH
+        model.to(device)
+        return tokenizer, model, device
+
+    def _onnx_session(self, model, tokenizer):
+        """ONNX Runtime session of the encoder, exported to `onnx_path` if missing."""
+        try:
+            import onnxruntime
+        except ImportError as e:
+            raise ImportError(
+                'The "onnx" reranker backend needs onnxruntime: pip install onnxruntime'
+            ) from e
+
+        if not os.path.exists(self.onnx_path):
+            os.makedirs(os.path.dirname(self.onnx_path) or ".", exist_ok=True)
+            sample = tokenizer(["export sample"], return_tensors="pt")
+            torch.onnx.export(
+                model,
+                (sample["input_ids"], sample["attention_mask"]),
+                self.onnx_path,
+                input_names=["input_ids", "attention_mask"],
+                output_names=["last_hidden_state"],
+                dynamic_axes={
+                    "input_ids": {0: "batch", 1: "sequence"},
+                    "attention_mask": {0: "batch", 1: "sequence"},
+                    "last_hidden_state": {0: "batch", 1: "sequence"},
+                },
+                opset_version=17,
+            )
+            print(f"Exported the reranker encoder to {self.onnx_path}")
+        return onnxruntime.InferenceSession(
+            self.onnx_path, providers=["CPUExecutionProvider"]
+        )
+
+    def load(self):
+        """
+        (tokenizer, model, device), loaded on first use and shared by every
+        ReRanker of the same model and backend in the process.
+        """
+        return shared(
+            (
+                "colbert",
+                self.model_name,
+                self.tokenizer_name,
+                self.backend,
+                self._requested_device,
+            ),
+            self._load,
+        )
+
+    @property
+    def _tokenizer(self):
+        return self.load()[0]
+
+    @property
+    def _model(self):
+        return self.load()[1]
+
+    @property
+    def _device(self):
+        return self.load()[2]
+
+    def _forward(self, encoding: dict) -> torch.Tensor:
+        if self.backend == "onnx":
+            (hidden,) = self._model.run(
+                ["last_hidden_state"],
+                {
+                    "input_ids": encoding["input_ids"].numpy(),
+                    "attention_mask": encoding["attention_mask"].numpy(),
+                },
+            )
+            return torch.from_numpy(hidden)
+        encoding = {k: v.to(self._device) for k, v in encoding.items()}
+        with torch.inference_mode():
+            return self._model(**encoding).last_hidden_state
+
+    def _encode_query(self, query: str) -> torch.Tensor:
+        """
+        Encode the query into its token embeddings.
+
+        Returns:
+            torch.Tensor: [query_len, embed_dim]
+        """
+        key = make_key(self.cache_name, query)
+        cached = self.query_cache.get(key)
+        if cached is not None:
+            return torch.from_numpy(cached).to(self._device)
 
-    def _calculate_sim(self, query: str, documents_text_list: List[str]) -> List[float]:
         query_encoding = self._tokenizer(
             query,
             return_tensors="pt",
             truncation=True,
             padding=True,
-            max_length=self.DEFAULT_COLBERT_MAX_LENGTH  # Which is set to 512!
+            max_length=self.DEFAULT_COLBERT_MAX_LENGTH,  # Which is set to 512!
+        )
+        query_embedding = self._forward(query_encoding)[0]
+        self.query_cache.set(key, query_embedding.cpu().numpy())
+        return query_embedding
+
+    def _encode_documents(
+        self, documents_text_list: List[str]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Encode documents in length-bucketed batches of `batch_size`.
+
+        Documents are sorted by token length so every batch is padded to roughly
+        the same length, then written back in their original order.
+
+        Returns:
+            Tuple[torch.Tensor, torch.Tensor]: token embeddings
+            [num_docs, max_doc_len, embed_dim] and the matching boolean mask
+            [num_docs, max_doc_len] (False on padding).
+        """
+        token_ids = self._tokenizer(
+            documents_text_list,
+            truncation=True,
+            max_length=self.DEFAULT_COLBERT_MAX_LENGTH,
+        )["input_ids"]
+        order = sorted(range(len(token_ids)), key=lambda i: len(token_ids[i]))
+        max_len = max(len(ids) for ids in token_ids)
+
+        embeddings = None
+        mask = torch.zeros(len(token_ids), max_len, dtype=torch.bool)
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start : start + self.batch_size]
+            metrics.observe("rerank_batch_size", len(bucket))
+            encoding = self._tokenizer.pad(
+                {"input_ids": [token_ids[i] for i in bucket]}, return_tensors="pt"
+            )
+            hidden = self._forward(encoding)  # [batch, bucket_len, embed_dim]
+            if embeddings is None:
+                embeddings = hidden.new_zeros(len(token_ids), max_len, hidden.size(-1))
+            bucket_len = hidden.size(1)
+            index = torch.tensor(bucket, device=hidden.device)
+            embeddings[index, :bucket_len] = hidden
+            mask[bucket, :bucket_len] = encoding["attention_mask"].bool()
+
+        return embeddings, mask.to(embeddings.device)
+
+    @staticmethod
+    def _maxsim(
+        query_embedding: torch.Tensor,
+        document_embeddings: torch.Tensor,
+        document_mask: torch.Tensor,
+    ) -> torch.Tensor:
+        """
+        ColBERT MaxSim over the whole candidate set in one tensor operation.
+
+        Args:
+            query_embedding: [query_len, embed_dim]
+            document_embeddings: [num_docs, doc_len, embed_dim]
+            document_mask: [num_docs, doc_len]
+
+        Returns:
+            torch.Tensor: [num_docs] mean over query tokens of the best cosine
+            similarity against any (non padding) document token.
+        """
+        query_embedding = torch.nn.functional.normalize(query_embedding, dim=-1)
+        document_embeddings = torch.nn.functional.normalize(document_embeddings, dim=-1)
+        sim_matrix = torch.einsum(
+            "qd,ntd->nqt", query_embedding, document_embeddings
+        )  # [num_docs, query_len, doc_len]
+        sim_matrix = sim_matrix.masked_fill(
+            ~document_mask.unsqueeze(1), float("-inf")
         )
-        
-        query_encoding = {k: v.to(self._device) for k, v in query_encoding.items()}
-        
-        query_embedding = self._model(
-            **query_encoding
-        ).last_hidden_state  # [1, query_len, embed_dim]
-
-        rerank_score_list = []
-
-        for document_text in documents_text_list:
-            document_encoding = self._tokenizer(
-                document_text,
+        max_sim_scores, _ = torch.max(sim_matrix, dim=2)  # [num_docs, query_len]
+        return torch.mean(max_sim_scores, dim=1)  # [num_docs]
+
+    def encode_documents(self, documents_text_list: List[str]) -> List[np.ndarray]:
+        """
+        Encode documents into unpadded fp16 token embedding matrices, in the
+        format kept by the TokenEmbeddingStore.
+        """
+        if not documents_text_list:
+            return []
+        document_embeddings, document_mask = self._encode_documents(
+            documents_text_list
+        )
+        return [
+            embedding[mask].to(torch.float16).cpu().numpy()
+            for embedding, mask in zip(document_embeddings, document_mask)
+        ]
+
+    def _encode_queries(self, queries: List[str]) -> List[torch.Tensor]:
+        """
+        Encode several queries in one forward pass, reusing the query cache.
+
+        Returns:
+            List[torch.Tensor]: [query_len, embed_dim] per query.
+        """
+        keys = [make_key(self.cache_name, query) for query in queries]
+        embeddings = [self.query_cache.get(key) for key in keys]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        if missing:
+            encoding = self._tokenizer(
+                [queries[i] for i in missing],
                 return_tensors="pt",
                 truncation=True,
                 padding=True,
-                max_length=self.DEFAULT_COLBERT_MAX_LENGTH
+                max_length=self.DEFAULT_COLBERT_MAX_LENGTH,
+            )
+            hidden = self._forward(encoding)  # [num_missing, query_len, embed_dim]
+            mask = encoding["attention_mask"].bool().to(hidden.device)
+            for row, i in enumerate(missing):
+                embeddings[i] = hidden[row][mask[row]].cpu().numpy()
+                self.query_cache.set(keys[i], embeddings[i])
+        return [torch.from_numpy(e).to(self._device) for e in embeddings]
+
+    def _document_tensors(
+        self,
+        documents_text_list: List[str],
+        stored_embeddings: List[Optional[np.ndarray]],
+    ) -> List[torch.Tensor]:
+        """
+        Unpadded [doc_len, embed_dim] token embeddings per document, from the
+        store when available and encoded live otherwise.
+        """
+        document_tensors = [
+            (
+                torch.from_numpy(np.asarray(e, dtype=np.float32)).to(self._device)
+                if e is not None
+                else None
             )
-            document_encoding = {k: v.to(self._device) for k, v in document_encoding.items()}
+            for e in stored_embeddings
+        ]
+        missing = [i for i, e in enumerate(stored_embeddings) if e is None]
+        if missing:
+            live_embeddings, live_mask = self._encode_documents(
+                [documents_text_list[i] for i in missing]
+            )
+            for row, i in enumerate(missing):
+                document_tensors[i] = live_embeddings[row][live_mask[row]]
+        return document_tensors
+
+    @staticmethod
+    def _pad(
+        document_tensors: List[torch.Tensor], dtype: torch.dtype
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Pad unpadded document embeddings to [num_docs, max_doc_len, embed_dim] with their mask."""
+        lengths = torch.tensor([t.size(0) for t in document_tensors])
+        document_embeddings = torch.nn.utils.rnn.pad_sequence(
+            [t.to(dtype) for t in document_tensors], batch_first=True
+        )
+        document_mask = (
+            torch.arange(document_embeddings.size(1)).unsqueeze(0)
+            < lengths.unsqueeze(1)
+        ).to(document_embeddings.device)
+        return document_embeddings, document_mask
 
-            document_embedding = self._model(
-                **document_encoding
-            ).last_hidden_state  # [1, doc_len, embed_dim]
+    def _calculate_sim(
+        self,
+        query: str,
+        documents_text_list: List[str],
+        stored_embeddings: Optional[List[Optional[np.ndarray]]] = None,
+    ) -> List[float]:
+        if not documents_text_list:
+            return []
 
-            # Compute similarity matrix between query tokens and doc tokens
-            sim_matrix = torch.nn.functional.cosine_similarity(
-                query_embedding.unsqueeze(2),  # [1, query_len, 1, embed_dim]
-                document_embedding.unsqueeze(1),  # [1, 1, doc_len, embed_dim]
-                dim=-1,
-            )  # [1, query_len, doc_len]
+        query_embedding = self._encode_query(query)
 
-            max_sim_scores, _ = torch.max(sim_matrix, dim=2)  # [1, query_len]
-            avg_score = torch.mean(max_sim_scores, dim=1)  # [1]
-            rerank_score_list.append(avg_score.item())  # Append as float
+        # Only the documents without precomputed token embeddings are encoded live
+        stored_embeddings = stored_embeddings or [None] * len(documents_text_list)
+        if all(e is None for e in stored_embeddings):
+            document_embeddings, document_mask = self._encode_documents(
+                documents_text_list
+            )
+        else:
+            document_embeddings, document_mask = self._pad(
+                self._document_tensors(documents_text_list, stored_embeddings),
+                query_embedding.dtype,
+            )
 
-        return rerank_score_list
+        scores = self._maxsim(query_embedding, document_embeddings, document_mask)
+        return scores.tolist()
 
+    @instrumented("rerank")
     def rerank(
         self, query: str, documents: List, top_k: int = 3
     ) -> List[Tuple[object, float]]:
@@ -81,11 +357,20 @@ class ReRanker:
             List[Tuple[Document, float]]: Top-k documents with their relevance scores.
         """
 
+        metrics.observe("rerank_candidates", len(documents))
+
         # Extract page content for scoring
         document_contents = [doc.page_content for doc in documents]
 
+        # Reuse precomputed token embeddings when the chunk is in the store
+        stored_embeddings = None
+        if self.store is not None:
+            stored_embeddings = [
+                self.store.get(doc.metadata.get("id")) for doc in documents
+            ]
+
         # Calculate similarity scores based on content
-        scores = self._calculate_sim(query, document_contents)
+        scores = self._calculate_sim(query, document_contents, stored_embeddings)
 
         # Pair Document objects with their scores
         scored_docs = list(zip(documents, scores))
@@ -94,3 +379,41 @@ class ReRanker:
         sorted_docs = sorted(scored_docs, key=lambda x: x[1], reverse=True)
 
         return sorted_docs[:top_k]
+
+    def rerank_many(
+        self, requests: List[Tuple[str, List, int]]
+    ) -> List[List[Tuple[object, float]]]:
+        """
+        Rerank several (query, documents, top_k) requests together: all the
+        queries are encoded in one forward pass and all the documents without
+        stored token embeddings in shared length-bucketed batches. Returns the
+        `rerank` result of every request, in order.
+        """
+        metrics.observe("rerank_requests_per_batch", len(requests))
+        query_embeddings = self._encode_queries([query for query, _, _ in requests])
+
+        documents = [doc for _, docs, _ in requests for doc in docs]
+        stored_embeddings = [
+            self.store.get(doc.metadata.get("id")) if self.store is not None else None
+            for doc in documents
+        ]
+        document_tensors = self._document_tensors(
+            [doc.page_content for doc in documents], stored_embeddings
+        )
+
+        results, offset = [], 0
+        for (_, docs, top_k), query_embedding in zip(requests, query_embeddings):
+            tensors = document_tensors[offset : offset + len(docs)]
+            offset += len(docs)
+            if not docs:
+                results.append([])
+                continue
+            document_embeddings, document_mask = self._pad(
+                tensors, query_embedding.dtype
+            )
+            scores = self._maxsim(query_embedding, document_embeddings, document_mask)
+            scored_docs = sorted(
+                zip(docs, scores.tolist()), key=lambda x: x[1], reverse=True
+            )
+            results.append(scored_docs[:top_k])
+        return results
@@ -0,0 +1,80 @@
+from concurrent.futures import Future
+from typing import List, Tuple
+import threading
+import queue
+import time
+import os
+
+from src.metrics import instrumented, metrics
+
+
+class RerankWorker:
+    """
+    Dynamic-batching front for a shared ReRanker.
+
+    Concurrent `rerank` callers (one thread per Streamlit session) put their
+    request on a queue and wait. A single worker thread takes the first
+    request, collects more for up to `max_wait` seconds or until `max_batch`
+    requests are queued, and serves them all with one `rerank_many` call, so
+    the forward passes are shared instead of competing for the torch threads.
+
+    Anything else (encode_documents, query_cache, ...) is delegated to the
+    wrapped reranker.
+    """
+
+    DEFAULT_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", 8))
+    DEFAULT_MAX_WAIT = float(os.getenv("RERANK_MAX_WAIT_MS", 10)) / 1000
+
+    def __init__(
+        self,
+        reranker,
+        max_batch: int = DEFAULT_MAX_BATCH,
+        max_wait: float = DEFAULT_MAX_WAIT,
+    ):
+        self.reranker = reranker
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name):
+        if name == "reranker":
+            raise AttributeError(name)
+        return getattr(self.reranker, name)
+
+    @instrumented("rerank")
+    def rerank(
+        self, query: str, documents: List, top_k: int = 3
+    ) -> List[Tuple[object, float]]:
+        metrics.observe("rerank_candidates", len(documents))
+        future = Future()
+        self._queue.put((query, documents, top_k, future))
+        return future.result()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            try:
+                results = self.reranker.rerank_many(
+                    [(query, documents, top_k) for query, documents, top_k, _ in batch]
+                )
+            except Exception as e:
+                for *_, future in batch:
+                    future.set_exception(e)
+                continue
+            for (*_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,75 @@
+from typing import Callable, Dict, Hashable, List
+import subprocess
+import threading
+import argparse
+import time
+import sys
+
+# Cold start budget for importing/launching the lightweight entry points
+IMPORT_BUDGET_SECONDS = 1.0
+
+_models: Dict[Hashable, object] = {}
+_locks: Dict[Hashable, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def shared(key: Hashable, factory: Callable[[], object]) -> object:
+    """
+    Process-wide model registry: build the object for `key` once with
+    `factory` and hand the same instance to every caller. Concurrent callers
+    of the same key wait for the first load instead of loading twice.
+    """
+    if key in _models:
+        return _models[key]
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _models:
+            started = time.perf_counter()
+            _models[key] = factory()
+            print(f"Loaded {key} in {time.perf_counter() - started:.1f}s.")
+    return _models[key]
+
+
+def warmup(load: Callable[[], object]) -> threading.Thread:
+    """Run `load` in a background thread so the first request does not wait for it."""
+    thread = threading.Thread(target=load, daemon=True)
+    thread.start()
+    return thread
+
+
+def measure_startup(command: List[str]) -> float:
+    """Wall time of `command` run in a fresh interpreter, in seconds."""
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, *command],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the cold start time of the lightweight entry points."
+    )
+    parser.add_argument("--budget", type=float, default=IMPORT_BUDGET_SECONDS)
+    args = parser.parse_args(argv)
+
+    commands = {
+        "import src.database": ["-c", "import src.database"],
+        "python -m src.database --help": ["-m", "src.database", "--help"],
+        "python -m src.ingest --help": ["-m", "src.ingest", "--help"],
+    }
+    over_budget = False
+    for name, command in commands.items():
+        elapsed = measure_startup(command)
+        over_budget |= elapsed > args.budget
+        status = "ok" if elapsed <= args.budget else "OVER BUDGET"
+        print(f"{name}: {elapsed:.2f}s ({status}, budget {args.budget:.2f}s)")
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
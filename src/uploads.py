@@ -0,0 +1,129 @@
+from typing import List, Optional, Set, Tuple
+import numpy as np
+import hashlib
+import pickle
+import time
+import os
+
+
+def file_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class UploadCache:
+    """
+    Parsed chunks and their embeddings of uploaded files, pickled under the
+    sha256 of the file content, so asking again about the same document does
+    not parse or embed it again.
+
+    Uploads are private, so entries do not outlive `max_age_days` and the
+    directory is kept under `max_bytes`, dropping the least recently used
+    entries first. Both are enforced on startup and after every write.
+    """
+
+    DEFAULT_MAX_AGE_DAYS = float(os.getenv("UPLOAD_CACHE_MAX_AGE_DAYS", 7))
+    DEFAULT_MAX_BYTES = int(float(os.getenv("UPLOAD_CACHE_MAX_MB", 512)) * 1024 * 1024)
+
+    def __init__(
+        self,
+        path: str = "data/upload_cache",
+        max_age_days: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        self.path = path
+        self.max_age = (
+            self.DEFAULT_MAX_AGE_DAYS if max_age_days is None else max_age_days
+        ) * 86400
+        self.max_bytes = self.DEFAULT_MAX_BYTES if max_bytes is None else max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.prune()
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, f"{digest}.pkl")
+
+    def _expired(self, mtime: float) -> bool:
+        return time.time() - mtime > self.max_age
+
+    def get(self, digest: str) -> Optional[Tuple[List, List[List[float]]]]:
+        path = self._file(digest)
+        try:
+            if self._expired(os.path.getmtime(path)):
+                os.remove(path)
+                return None
+            with open(path, "rb") as file:
+                entry = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        # The modification time doubles as the last use, for the size bound
+        os.utime(path)
+        return entry["chunks"], entry["embeddings"]
+
+    def set(self, digest: str, chunks: List, embeddings: List[List[float]]) -> None:
+        tmp_path = self._file(digest) + ".tmp"
+        with open(tmp_path, "wb") as file:
+            pickle.dump({"chunks": chunks, "embeddings": embeddings}, file)
+        os.replace(tmp_path, self._file(digest))
+        self.prune()
+
+    def prune(self) -> int:
+        """Delete expired entries, then the least recently used ones over the size bound."""
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith(".pkl"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        entries.sort(reverse=True)
+        removed, total = 0, 0
+        for mtime, size, name in entries:
+            total += size
+            if self._expired(mtime) or total > self.max_bytes:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except FileNotFoundError:
+                    pass
+                removed += 1
+                total -= size
+        return removed
+
+
+class SessionIndex:
+    """
+    In-memory (brute force cosine) vector index of the files uploaded in one UI
+    session. It is searched alongside the shared collection and goes away with
+    the session, so private documents never reach the shared HNSW index.
+    """
+
+    def __init__(self):
+        self.digests: Set[str] = set()
+        self.documents: List = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add(self, digest: str, chunks: List, embeddings: List[List[float]]) -> None:
+        if digest in self.digests or not chunks:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+        self._matrix = vectors if not self.documents else np.vstack([self._matrix, vectors])
+        self.documents.extend(chunks)
+        self.digests.add(digest)
+
+    def search(
+        self, query_embedding: List[float], k: int = 10, excluded_ids: Set[str] = None
+    ) -> List:
+        if not self.documents:
+            return []
+        query = np.asarray(query_embedding, dtype=np.float32)
+        scores = self._matrix @ (query / (np.linalg.norm(query) + 1e-12))
+        excluded_ids = excluded_ids or set()
+        return [
+            self.documents[i]
+            for i in np.argsort(-scores)
+            if self.documents[i].metadata.get("id") not in excluded_ids
+        ][:k]
@@ -1,14 +1,45 @@
+from contextlib import contextmanager
+from functools import lru_cache
+import contextvars
 import os
 
+# Name of the graph node currently executing, for per-node cache and metrics
+current_node = contextvars.ContextVar("current_node", default=None)
+
+
+@contextmanager
+def node_scope(name):
+    token = current_node.set(name)
+    try:
+        yield
+    finally:
+        current_node.reset(token)
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text, model="gpt-4o-mini"):
+    """Token count of `text` with tiktoken, about 4 characters per token without it."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
 def check_required_env_vars():
     required_env_vars = {
         "LLAMA_CLOUD_API_KEY": os.environ.get("LLAMA_CLOUD_API_KEY", None),
         "OPENAI_API_KEY" : os.environ.get("OPENAI_API_KEY", None),
-        "LANGSMITH_TRACING": os.environ.get("LANGSMITH_TRACING", True),
-        "LANGCHAIN_TRACING_V2": os.environ.get("LANGCHAIN_TRACING_V2", True),
-        "LANGSMITH_ENDPOINT": os.environ.get("LANGSMITH_ENDPOINT", "https://api.smith.langchain.com"),
-        "LANGSMITH_API_KEY": os.environ.get("LANGSMITH_API_KEY", None),
-        "LANGSMITH_PROJECT": os.environ.get("LANGSMITH_PROJECT", "louisAI"),
         "TAVILY_API_KEY": os.environ.get("TAVILY_API_KEY", None),
     }
     missing_env_vars = {key: value for key, value in required_env_vars.items() if value is None}
@@ -18,5 +49,13 @@ def check_required_env_vars():
 
     if missing_env_vars:
         raise ValueError(f"Missing required environment variables: {missing_env_vars}")
+
+    # LangSmith is optional (see src.metrics), only trace when a key is set
+    for key in ("LANGSMITH_TRACING", "LANGCHAIN_TRACING_V2"):
+        if os.environ.get("LANGSMITH_API_KEY"):
+            os.environ.setdefault(key, "true")
+        else:
+            os.environ[key] = "false"
+    os.environ.setdefault("LANGSMITH_PROJECT", "louisAI")
     
     return missing_env_vars
\ No newline at end of file
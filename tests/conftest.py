@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+import pytest
+
+
+def corpus_row(version_id, text, citation="R v NGUYEN [2001] NSWCCA 334"):
+    """A row shaped like open-australian-legal-qa."""
+    return {
+        "question": f"What does {citation} say?",
+        "source": {
+            "version_id": version_id,
+            "type": "decision",
+            "jurisdiction": "new_south_wales",
+            "source": "nsw_caselaw",
+            "citation": citation,
+            "text": text,
+            "url": f"https://example.org/{version_id}",
+        },
+    }
+
+
+class FakeVectorDB:
+    """In-memory stand-in for the parts of VectorDB the ingest pipeline uses."""
+
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.rows = {}
+        self.citations = []
+        self.token_store_ids = []
+        self.corpus_version = 0
+        self.vector_store = SimpleNamespace(add_embeddings=self._add_embeddings)
+        self.citation_index = SimpleNamespace(
+            add=self.citations.extend,
+            indexed_ids=lambda: {doc.metadata["id"] for doc in self.citations},
+        )
+
+    def _add_embeddings(self, texts, embeddings, metadatas, ids):
+        for text, embedding, metadata, id in zip(texts, embeddings, metadatas, ids):
+            self.rows[id] = (text, embedding, metadata)
+
+    def build_token_embedding_store(self, documents):
+        self.token_store_ids.extend(doc.metadata["id"] for doc in documents)
+
+    def bump_corpus_version(self):
+        self.corpus_version += 1
+
+    def existing_ids(self):
+        return set(self.rows)
+
+    def iter_texts(self):
+        for text, _, _ in self.rows.values():
+            yield text
+
+    def delete_documents(self, ids):
+        for id in ids:
+            self.rows.pop(id, None)
+
+
+@pytest.fixture
+def fake_db():
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+
+    return FakeVectorDB(DeterministicFakeEmbedding(size=8))
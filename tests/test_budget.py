@@ -0,0 +1,56 @@
+from langchain_core.outputs import LLMResult
+from langgraph.graph import END
+
+from src.budget import BUDGET_EXHAUSTED, RequestBudget, bounded_route, budget_config
+
+PATH_MAP = {"retry": "intent_identification", "done": END, BUDGET_EXHAUSTED: BUDGET_EXHAUSTED}
+
+
+def _budget(**kwargs):
+    return RequestBudget(**{"deadline_seconds": None, "max_tokens": None, **kwargs})
+
+
+def test_route_is_unchanged_without_budget():
+    route = bounded_route(lambda state: "retry", PATH_MAP, cycles={"retry": "quality"})
+    assert route({}) == "retry"
+
+
+def test_cycle_is_bounded_by_max_iterations():
+    budget = _budget(max_iterations=2)
+    route = bounded_route(lambda state: "retry", PATH_MAP, cycles={"retry": "quality"})
+    state = {"budget": budget}
+    assert [route(state) for _ in range(3)] == ["retry", "retry", BUDGET_EXHAUSTED]
+    assert budget.reason == "iterations:quality"
+
+
+def test_end_is_always_allowed():
+    budget = _budget(deadline_seconds=-1)
+    route = bounded_route(lambda state: "done", PATH_MAP)
+    assert route({"budget": budget}) == "done"
+
+
+def test_deadline_and_tokens_exhaust_the_budget():
+    route = bounded_route(lambda state: "retry", PATH_MAP)
+    assert route({"budget": _budget(deadline_seconds=-1)}) == BUDGET_EXHAUSTED
+
+    budget = _budget(max_tokens=100)
+    budget.on_llm_end(
+        LLMResult(generations=[[]], llm_output={"token_usage": {"total_tokens": 150}})
+    )
+    assert budget.tokens == 150
+    assert route({"budget": budget}) == BUDGET_EXHAUSTED
+    assert budget.exhausted() == "tokens"
+
+
+def test_best_response_is_recorded():
+    budget = _budget()
+    budget.record({"response": "bad", "hallucination": True, "quality": False}, ["hallucination", "quality"])
+    budget.record({"response": "good", "hallucination": False, "quality": True}, ["hallucination", "quality"])
+    budget.record({"response": "worse", "hallucination": True, "quality": True}, ["hallucination", "quality"])
+    assert budget.best_response == "good"
+
+
+def test_budget_config_appends_callback():
+    budget = _budget()
+    assert budget_config(None) == {}
+    assert budget_config(budget, {"callbacks": ["other"]})["callbacks"] == ["other", budget]
@@ -0,0 +1,36 @@
+from src.citations import (
+    citation_keys,
+    extract_query_citation_keys,
+    neutral_citation_keys,
+    party_name_keys,
+)
+
+
+def test_neutral_citation_keys():
+    assert neutral_citation_keys("see [2001] nswcca 334 and [1992] HCA 23") == [
+        "ncit:2001 NSWCCA 334",
+        "ncit:1992 HCA 23",
+    ]
+
+
+def test_party_name_keys():
+    assert party_name_keys("What did Mabo v Queensland (No 2) decide?") == [
+        "party:mabo v queensland no 2"
+    ]
+    assert party_name_keys("Smith v. Jones") == ["party:smith v jones"]
+
+
+def test_citation_keys_of_stored_citation():
+    assert citation_keys("R v NGUYEN [2001] NSWCCA 334") == [
+        "ncit:2001 NSWCCA 334",
+        "party:r v nguyen",
+    ]
+
+
+def test_query_prefers_neutral_citations():
+    query = "In the case of R v NGUYEN [2001] NSWCCA 334, what was the relationship?"
+    assert extract_query_citation_keys(query) == ["ncit:2001 NSWCCA 334"]
+    assert extract_query_citation_keys("What did R v Nguyen decide?") == [
+        "party:r v nguyen"
+    ]
+    assert extract_query_citation_keys("What is the limitation period?") == []
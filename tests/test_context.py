@@ -0,0 +1,62 @@
+from langchain_core.documents import Document
+
+import src.context as context
+
+
+def _words(text):
+    return len(text.split())
+
+
+def _doc(id, text=None, citation=""):
+    return Document(page_content=text or f"text of {id}", metadata={"id": id, "citation": citation})
+
+
+def test_select_passages_keeps_text_that_fits(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", _words)
+    assert context.select_passages("short text", 10, "query") == "short text"
+
+
+def test_select_passages_prefers_paragraphs_matching_the_query(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", _words)
+    text = "bail conditions were imposed\n\nthe weather was fine\n\nbail was refused"
+    assert context.select_passages(text, 7, "was bail refused") == (
+        "bail conditions were imposed\n\nbail was refused"
+    )
+
+
+def test_select_passages_truncates_a_single_oversized_paragraph(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", _words)
+    selected = context.select_passages("one two three four five six seven eight", 4, "one")
+    assert context.count_tokens(selected) <= 4
+
+
+def test_rank_documents_interleaves_retrieval_passes():
+    documents = [_doc("a1"), _doc("a2"), _doc("b1"), _doc("b2")]
+    ranks = {"a1": (0, 0), "a2": (1, 0), "b1": (0, 1), "b2": (1, 1)}
+    ranked = context.rank_documents(documents, retrieval_ranks=ranks)
+    assert [doc.metadata["id"] for doc in ranked] == ["a1", "b1", "a2", "b2"]
+
+
+def test_rank_documents_puts_cited_passages_first():
+    documents = [_doc("a"), _doc("b", citation="R v NGUYEN [2001] NSWCCA 334")]
+    ranked = context.rank_documents(documents, answer="As held in [2001] NSWCCA 334")
+    assert [doc.metadata["id"] for doc in ranked] == ["b", "a"]
+
+
+def test_select_documents_respects_budget(monkeypatch):
+    monkeypatch.setattr(context, "count_tokens", _words)
+    documents = [_doc("a", "one two three"), _doc("b", "one two"), _doc("c", "one")]
+    selected = context.select_documents(documents, 4)
+    assert [doc.metadata["id"] for doc in selected] == ["a", "c"]
+
+
+def test_response_graders_only_see_the_response_documents():
+    state = {
+        "query": "query",
+        "retrieved_docs": [_doc("a"), _doc("b")],
+        "response_doc_ids": ["b"],
+    }
+    _, _, documents = context.assemble_context(state, "grader_hallucination")
+    assert [doc.metadata["id"] for doc in documents] == ["b"]
+    _, _, documents = context.assemble_context(state, "completeness")
+    assert [doc.metadata["id"] for doc in documents] == ["a", "b"]
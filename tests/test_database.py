@@ -0,0 +1,26 @@
+from langchain_core.documents import Document
+
+from src.database import LexicalIndexing, reciprocal_rank_fusion
+
+
+def _doc(id):
+    return Document(page_content=id, metadata={"id": id})
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[_doc("a"), _doc("b"), _doc("c")], [_doc("c"), _doc("b")]])
+    # c: 1/63 + 1/61, b: 1/62 + 1/62, a: 1/61
+    assert [doc.metadata["id"] for doc in fused] == ["c", "b", "a"]
+
+
+def test_reciprocal_rank_fusion_keeps_single_list_order():
+    fused = reciprocal_rank_fusion([[_doc("a"), _doc("b")], []])
+    assert [doc.metadata["id"] for doc in fused] == ["a", "b"]
+
+
+def test_search_terms_are_distinct_and_capped(monkeypatch):
+    assert LexicalIndexing.search_terms("R v NGUYEN [2001] NSWCCA 334 or nguyen") == (
+        "nguyen or 2001 or nswcca or 334"
+    )
+    monkeypatch.setattr(LexicalIndexing, "MAX_QUERY_TERMS", 2)
+    assert LexicalIndexing.search_terms("bail concerns risk flight") == "bail or concerns"
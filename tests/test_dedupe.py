@@ -0,0 +1,49 @@
+from src.dedupe import MinHashDeduplicator, deduplicate
+from langchain_core.documents import Document
+
+TEXT = (
+    "A bail authority must assess any bail concerns, including whether the "
+    "accused person, if released, will fail to appear, commit a serious "
+    "offence, endanger the safety of victims or the community, or interfere "
+    "with witnesses or evidence."
+)
+
+
+def test_exact_duplicate_ignores_case_and_whitespace():
+    deduplicator = MinHashDeduplicator()
+    assert not deduplicator.is_duplicate(TEXT)
+    assert deduplicator.is_duplicate("  " + TEXT.upper().replace(" ", "\n "))
+    assert deduplicator.exact_duplicates == 1
+    assert deduplicator.near_duplicates == 0
+
+
+def test_near_duplicate():
+    deduplicator = MinHashDeduplicator(threshold=0.5)
+    assert not deduplicator.is_duplicate(TEXT)
+    assert deduplicator.is_duplicate(TEXT + " It must also consider the bail conditions.")
+    assert deduplicator.near_duplicates == 1
+
+
+def test_distinct_texts_are_kept():
+    deduplicator = MinHashDeduplicator()
+    assert not deduplicator.is_duplicate(TEXT)
+    assert not deduplicator.is_duplicate(
+        "The common law of Australia recognises a form of native title reflecting "
+        "the entitlement of the indigenous inhabitants to their traditional lands."
+    )
+    assert deduplicator.skipped == 0
+
+
+def test_signature_is_deterministic():
+    assert (MinHashDeduplicator().signature(TEXT) == MinHashDeduplicator().signature(TEXT)).all()
+
+
+def test_deduplicate_keeps_first_occurrence():
+    documents = [
+        Document(page_content=TEXT, metadata={"id": "a"}),
+        Document(page_content=TEXT, metadata={"id": "b"}),
+        Document(page_content="Something else entirely.", metadata={"id": "c"}),
+    ]
+    kept, deduplicator = deduplicate(documents)
+    assert [doc.metadata["id"] for doc in kept] == ["a", "c"]
+    assert deduplicator.skipped == 1
@@ -0,0 +1,50 @@
+import numpy as np
+import os
+
+from src.embedding_store import TokenEmbeddingStore
+
+
+def _matrix(rows, dim=4, value=1.0):
+    return np.full((rows, dim), value, dtype=np.float32)
+
+
+def test_add_and_get(tmp_path):
+    store = TokenEmbeddingStore(str(tmp_path))
+    assert store.add([("a", _matrix(2, value=1)), ("b", _matrix(3, value=2))]) == 2
+    assert store.get("a").shape == (2, 4)
+    assert store.get("a").dtype == np.float16
+    assert (store.get("b") == 2).all()
+    assert store.get("missing") is None
+    assert store.missing(["a", "c"]) == ["c"]
+
+
+def test_existing_chunks_are_skipped_and_reloaded(tmp_path):
+    store = TokenEmbeddingStore(str(tmp_path))
+    store.add([("a", _matrix(2))])
+    assert store.add([("a", _matrix(5)), ("b", _matrix(1, value=3))]) == 1
+
+    reopened = TokenEmbeddingStore(str(tmp_path))
+    assert len(reopened) == 2
+    assert reopened.get("a").shape == (2, 4)
+    assert (reopened.get("b") == 3).all()
+
+
+def test_remove(tmp_path):
+    store = TokenEmbeddingStore(str(tmp_path))
+    store.add([("a", _matrix(2)), ("b", _matrix(2, value=2))])
+    assert store.remove(["a", "missing"]) == 1
+    assert "a" not in TokenEmbeddingStore(str(tmp_path))
+    assert (TokenEmbeddingStore(str(tmp_path)).get("b") == 2).all()
+
+
+def test_unindexed_rows_of_an_interrupted_write_are_truncated(tmp_path):
+    store = TokenEmbeddingStore(str(tmp_path))
+    store.add([("a", _matrix(2, value=1))])
+    # Rows written to the file but never recorded in the index
+    with open(os.path.join(str(tmp_path), TokenEmbeddingStore.EMBEDDINGS_FILE), "ab") as file:
+        file.write(_matrix(3, value=9).astype(np.float16).tobytes())
+
+    store = TokenEmbeddingStore(str(tmp_path))
+    store.add([("b", _matrix(1, value=2))])
+    assert (store.get("a") == 1).all()
+    assert (store.get("b") == 2).all()
@@ -0,0 +1,83 @@
+from src.ingest import IngestCheckpoint, IngestPipeline, chunk_id
+
+from conftest import corpus_row
+
+BAIL = (
+    "A bail authority must assess any bail concerns, including whether the "
+    "accused person will fail to appear or commit a serious offence."
+)
+TITLE = (
+    "The common law of Australia recognises a form of native title reflecting "
+    "the entitlement of the indigenous inhabitants to their traditional lands."
+)
+TENANCY = "A landlord must give a tenant at least 60 days notice of a rent increase."
+
+
+def _rows():
+    return [
+        corpus_row("v1", BAIL),
+        corpus_row("v2", TITLE, citation="Mabo v Queensland (No 2) [1992] HCA 23"),
+        # The QA dataset repeats sources
+        corpus_row("v1", BAIL),
+        # Same text under another version is a duplicate chunk
+        corpus_row("v3", BAIL),
+    ]
+
+
+def test_run_writes_unique_chunks(fake_db):
+    pipeline = IngestPipeline(fake_db, batch_size=2)
+    assert pipeline.run(_rows()) == 2
+    assert len(fake_db.rows) == 2
+    assert all(len(embedding) == 8 for _, embedding, _ in fake_db.rows.values())
+    assert sorted(fake_db.token_store_ids) == sorted(fake_db.rows)
+    assert fake_db.corpus_version == 1
+    assert pipeline.deduplicator.exact_duplicates == 1
+
+
+def test_chunk_ids_are_content_addressed(fake_db):
+    IngestPipeline(fake_db).run([corpus_row("v1", BAIL)])
+    text, _, metadata = next(iter(fake_db.rows.values()))
+    assert metadata["id"] == chunk_id(text, "v1")
+
+
+def test_checkpoint_records_whole_rows(fake_db, tmp_path):
+    checkpoint = IngestCheckpoint(str(tmp_path / "checkpoint.json"))
+    rows = _rows() + [corpus_row("v4", TENANCY, citation="")]
+    IngestPipeline(fake_db, batch_size=1, checkpoint=checkpoint).run(rows)
+    assert IngestCheckpoint(str(tmp_path / "checkpoint.json")).rows_done == 5
+
+
+def test_resume_skips_done_rows_and_dedupes_against_stored_chunks(fake_db, tmp_path):
+    IngestPipeline(fake_db).run(_rows()[:2])
+    checkpoint = IngestCheckpoint(str(tmp_path / "checkpoint.json"))
+    checkpoint.save(2)
+
+    pipeline = IngestPipeline(fake_db, checkpoint=checkpoint)
+    written = pipeline.run(_rows() + [corpus_row("v4", TENANCY, citation="")])
+    assert written == 1
+    assert len(fake_db.rows) == 3
+    # Rows 3 and 4 repeat a chunk written before the checkpoint
+    assert pipeline.deduplicator.exact_duplicates == 2
+
+
+def test_incremental_run_only_writes_new_chunks_and_prunes(fake_db):
+    IngestPipeline(fake_db).run(_rows())
+    stale = chunk_id("stale", "v0")
+    fake_db.rows[stale] = ("stale", [0.0] * 8, {"id": stale})
+
+    pipeline = IngestPipeline(fake_db, incremental=True, prune=True)
+    assert pipeline.run(_rows() + [corpus_row("v4", TENANCY, citation="")]) == 1
+    assert pipeline.skipped == 2
+    assert stale not in fake_db.rows
+    assert len(fake_db.rows) == 3
+
+
+def test_incremental_run_backfills_only_unindexed_citations(fake_db):
+    IngestPipeline(fake_db).run(_rows())
+    indexed = len(fake_db.citations)
+    IngestPipeline(fake_db, incremental=True).run(_rows())
+    assert len(fake_db.citations) == indexed
+
+    fake_db.citations.clear()
+    IngestPipeline(fake_db, incremental=True).run(_rows())
+    assert len(fake_db.citations) == indexed
@@ -0,0 +1,19 @@
+import pytest
+import os
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytestmark = pytest.mark.skipif(
+    not os.getenv("RERANKER_PARITY_TESTS"),
+    reason="downloads the ColBERT model, set RERANKER_PARITY_TESTS=1",
+)
+
+
+@pytest.mark.parametrize("backend", ["torch-int8", "onnx"])
+def test_backend_matches_fp32_torch(backend):
+    if backend == "onnx":
+        pytest.importorskip("onnxruntime")
+    from src.benchmark import compare_backends
+
+    [result] = compare_backends([backend], repeats=1)
+    assert result["passed"], result
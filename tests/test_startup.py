@@ -0,0 +1,7 @@
+from src.startup import IMPORT_BUDGET_SECONDS, measure_startup
+
+
+def test_database_module_imports_within_budget():
+    # Twice so the first run can warm up the bytecode cache
+    measure_startup(["-c", "import src.database"])
+    assert measure_startup(["-c", "import src.database"]) < IMPORT_BUDGET_SECONDS
@@ -0,0 +1,18 @@
+import src.nodes.summarise as summarise
+
+
+def _words(text):
+    return len(text.split())
+
+
+def test_group_by_tokens_packs_consecutive_parts(monkeypatch):
+    monkeypatch.setattr(summarise, "count_tokens", _words)
+    parts = ["a b", "c d", "e f g", "h"]
+    assert summarise._group_by_tokens(parts, max_tokens=4) == [["a b", "c d"], ["e f g", "h"]]
+
+
+def test_group_by_tokens_splits_oversized_parts(monkeypatch):
+    monkeypatch.setattr(summarise, "count_tokens", _words)
+    groups = summarise._group_by_tokens(["one two three four five six"], max_tokens=3)
+    assert len(groups) > 1
+    assert "".join(piece for group in groups for piece in group) == "one two three four five six"
@@ -0,0 +1,33 @@
+import os
+import time
+
+from src.uploads import UploadCache
+
+
+def test_round_trip(tmp_path):
+    cache = UploadCache(str(tmp_path))
+    cache.set("a", ["chunk"], [[1.0, 0.0]])
+    assert cache.get("a") == (["chunk"], [[1.0, 0.0]])
+    assert cache.get("missing") is None
+
+
+def test_expired_entries_are_removed(tmp_path):
+    cache = UploadCache(str(tmp_path), max_age_days=1)
+    cache.set("a", ["chunk"], [[1.0]])
+    old = time.time() - 2 * 86400
+    os.utime(os.path.join(tmp_path, "a.pkl"), (old, old))
+    assert cache.get("a") is None
+    assert not os.listdir(tmp_path)
+
+
+def test_size_bound_drops_least_recently_used(tmp_path):
+    cache = UploadCache(str(tmp_path))
+    for i, digest in enumerate(["a", "b", "c"]):
+        cache.set(digest, ["x" * 1000], [[0.0]])
+        then = time.time() - 100 + i
+        os.utime(os.path.join(tmp_path, f"{digest}.pkl"), (then, then))
+    cache.get("a")
+    entry_size = os.path.getsize(os.path.join(tmp_path, "b.pkl"))
+    cache.max_bytes = 2 * entry_size
+    assert cache.prune() == 1
+    assert sorted(os.listdir(tmp_path)) == ["a.pkl", "c.pkl"]